@@ -182,7 +182,6 @@ class GoogleMailMessageAdmin(admin.ModelAdmin):
         "created_at",
     )
     search_fields = (
-        "raw", 
         "snippet", 
         "message_id", 
         "thread_id",
@@ -266,8 +265,9 @@ class GoogleMailMessageAdmin(admin.ModelAdmin):
         return "\n".join(result)
 
     def get_queryset(self, request):
-        # Optimize queries by prefetching related email addresses
-        return super().get_queryset(request).prefetch_related(
+        # Optimize queries by prefetching related email addresses; the raw
+        # content is needed for the header columns
+        return super().get_queryset(request).select_related('raw_body').prefetch_related(
             'email_addresses',
             'messageemailaddress_set__email_address'
         )
@@ -10,6 +10,9 @@ from django.db.models import Q, F
 
 logger = logging.getLogger(__name__)
 
+# Operations understood by EmailIndexingService.run_maintenance, in execution order
+MAINTENANCE_OPERATIONS = ('validate', 'fix_missing', 'cleanup')
+
 
 class EmailIndexingService:
     """Service class for managing email address indexing operations"""
@@ -34,8 +37,9 @@ class EmailIndexingService:
                 relationships_created = 0
                 
                 # Map email fields to their values
+                header_from = message.header_from
                 email_field_mapping = [
-                    ('from', [message.header_from] if message.header_from else []),
+                    ('from', [header_from] if header_from else []),
                     ('to', message.header_to or []),
                     ('cc', message.header_cc or []),
                     # Note: Add bcc, reply_to etc. when available
@@ -118,7 +122,7 @@ class EmailIndexingService:
             # Update display name if this one is better
             if decoded_name and not indexed_email.display_name:
                 indexed_email.display_name = decoded_name
-                indexed_email.save()
+                indexed_email.save(update_fields=['display_name'])
             
             # Create the relationship
             relationship, created = MessageEmailAddress.objects.get_or_create(
@@ -138,9 +142,7 @@ class EmailIndexingService:
     def _update_message_counts_for_message(message: GoogleMailMessage):
         """Update message counts for all email addresses in a specific message"""
         try:
-            for email_addr in message.email_addresses.all():
-                email_addr.message_count = email_addr.messages.count()
-                email_addr.save()
+            IndexedEmailAddress.objects.filter(messages=message).refresh_message_counts()
         except Exception as e:
             logger.error(f'Error updating message counts for message {message.message_id}: {e}')
             raise
@@ -168,7 +170,10 @@ class EmailIndexingService:
         
         for batch_start in range(0, total_messages, batch_size):
             batch_end = min(batch_start + batch_size, total_messages)
-            batch_messages = messages_queryset[batch_start:batch_end]
+            # Indexing only reads the headers, so skip the other message columns
+            batch_messages = messages_queryset.select_related('raw_body').only(
+                'message_id', 'internal_date', 'raw_body__raw'
+            )[batch_start:batch_end]
             
             if progress_callback:
                 progress_callback(batch_start, batch_end, total_messages)
@@ -213,7 +218,7 @@ class EmailIndexingService:
                     indexed_email.message_count = message_count
                     indexed_email.first_seen = first_seen
                     indexed_email.last_seen = last_seen
-                    indexed_email.save()
+                    indexed_email.save(update_fields=['message_count', 'first_seen', 'last_seen'])
         except Exception as e:
             logger.error(f'Error updating all message counts: {e}')
             raise
@@ -501,6 +506,59 @@ class EmailIndexingService:
             logger.error(f'Error during maintenance cleanup: {e}')
             raise
 
+    @staticmethod
+    def run_maintenance(
+        operations: Optional[List[str]] = None,
+        account_email: Optional[str] = None,
+        batch_size: int = 1000,
+        progress: Optional[callable] = None
+    ) -> dict:
+        """
+        Run maintenance operations and collect final index statistics.
+
+        Args:
+            operations: Operations to run, any of MAINTENANCE_OPERATIONS (default: all)
+            account_email: If provided, only process messages for this account
+            batch_size: Number of messages to process in each batch
+            progress: Optional callback called as progress(operation, None) before
+                and progress(operation, results) after each operation
+
+        Returns:
+            Dictionary containing the results of each operation that ran
+        """
+        if operations is None:
+            operations = MAINTENANCE_OPERATIONS
+
+        def report(operation, operation_results=None):
+            if progress:
+                progress(operation, operation_results)
+
+        results = {}
+
+        if 'validate' in operations:
+            report('validate')
+            results['validation'] = EmailIndexingService.validate_index(account_email)
+            report('validate', results['validation'])
+
+        if 'fix_missing' in operations:
+            report('fix_missing')
+            results['fix_missing'] = EmailIndexingService.fix_missing_entries(
+                account_email=account_email,
+                batch_size=batch_size
+            )
+            report('fix_missing', results['fix_missing'])
+
+        if 'cleanup' in operations:
+            report('cleanup')
+            results['cleanup'] = EmailIndexingService.maintenance_cleanup()
+            report('cleanup', results['cleanup'])
+
+        report('statistics')
+        results['statistics'] = EmailIndexingService.get_index_statistics(account_email)
+        report('statistics', results['statistics'])
+
+        return results
+
     @staticmethod
     def get_index_statistics(account_email: Optional[str] = None) -> dict:
         """
@@ -203,7 +203,7 @@ class Command(BaseCommand):
 
     def _display_recent_messages(self):
         """Display a summary of recent messages."""
-        recent_messages = GoogleMailMessage.objects.order_by('-internal_date')[:5]
+        recent_messages = GoogleMailMessage.objects.select_related('raw_body').order_by('-internal_date')[:5]
         
         if recent_messages:
             console.print("\n[bold]Recent Messages:[/bold]")
@@ -9,6 +9,18 @@ from google_email_indexer.models import GoogleMailMessage
 
 console = Console()
 
+# Subject prefix for every (is_read, is_starred, is_important) combination
+STATUS_PREFIX = {
+    (is_read, is_starred, is_important): (
+        ("📧 " if not is_read else "")
+        + ("⭐ " if is_starred else "")
+        + ("🔥 " if is_important else "")
+    )
+    for is_read in (False, True)
+    for is_starred in (False, True)
+    for is_important in (False, True)
+}
+
 
 class Command(BaseCommand):
     help = "Display the last 'n' messages in a nice rich table format"
@@ -38,18 +50,26 @@ class Command(BaseCommand):
             action="store_true",
             help="Show only starred messages"
         )
+        
+        parser.add_argument(
+            "--label",
+            action="append",
+            dest="labels",
+            help="Show only messages with this Gmail label ID (can be used multiple times)"
+        )
 
     def handle(self, *args, **kwargs):
         count = kwargs["count"]
         account_email = kwargs["account_email"]
         unread_only = kwargs["unread_only"]
         starred_only = kwargs["starred_only"]
+        labels = kwargs["labels"]
         
         console.print(f"[bold blue]Last {count} Messages[/bold blue]")
         console.print("=" * 60)
         
         # Build the queryset
-        queryset = GoogleMailMessage.objects.all()
+        queryset = GoogleMailMessage.objects.select_related('raw_body')
         
         # Apply filters
         if account_email:
@@ -64,6 +84,10 @@ class Command(BaseCommand):
             queryset = queryset.filter(is_starred=True)
             console.print("[dim]Showing starred messages only[/dim]")
         
+        if labels:
+            queryset = queryset.with_any_label(labels)
+            console.print(f"[dim]Filtered by labels: {', '.join(labels)}[/dim]")
+        
         # Get the messages ordered by date (newest first)
         messages = queryset.order_by('-internal_date')[:count]
         
@@ -105,15 +129,7 @@ class Command(BaseCommand):
                 subject = subject[:34] + "..."
             
             # Add status indicators
-            status_indicators = []
-            if not msg.is_read:
-                status_indicators.append("📧")
-            if msg.is_starred:
-                status_indicators.append("⭐")
-            if msg.is_important:
-                status_indicators.append("🔥")
-            
-            status_prefix = " ".join(status_indicators) + " " if status_indicators else ""
+            status_prefix = STATUS_PREFIX[(msg.is_read, msg.is_starred, msg.is_important)]
             
             table.add_row(
                 date_str,
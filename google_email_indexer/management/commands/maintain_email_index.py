@@ -1,6 +1,6 @@
 import logging
 from django.core.management.base import BaseCommand
-from google_email_indexer.email_indexing_service import EmailIndexingService
+from google_email_indexer.email_indexing_service import EmailIndexingService, MAINTENANCE_OPERATIONS
 
 logger = logging.getLogger(__name__)
 
@@ -70,58 +70,46 @@ class Command(BaseCommand):
         else:
             logging.getLogger().setLevel(logging.INFO)
 
-        results = {}
-
-        # Validate index
-        if validate_only or full_maintenance:
-            if not quiet:
-                self.stdout.write('Validating email index...')
-            
-            validation_results = EmailIndexingService.validate_index(account_email)
-            results['validation'] = validation_results
-            
-            if not quiet:
-                self._print_validation_results(validation_results)
-
-        # Fix missing entries
-        if fix_missing or full_maintenance:
-            if not quiet:
-                self.stdout.write('Fixing missing index entries...')
-            
-            fix_results = EmailIndexingService.fix_missing_entries(
-                account_email=account_email,
-                batch_size=batch_size
-            )
-            results['fix_missing'] = fix_results
-            
-            if not quiet:
-                self._print_fix_results(fix_results)
-
-        # Cleanup orphaned entries
-        if cleanup or full_maintenance:
-            if not quiet:
-                self.stdout.write('Cleaning up orphaned email addresses...')
-            
-            cleanup_results = EmailIndexingService.maintenance_cleanup()
-            results['cleanup'] = cleanup_results
-            
-            if not quiet:
-                self._print_cleanup_results(cleanup_results)
-
-        # Get final statistics
-        if not quiet:
-            self.stdout.write('Getting final index statistics...')
-        
-        stats = EmailIndexingService.get_index_statistics(account_email)
-        results['statistics'] = stats
-        
-        if not quiet:
-            self._print_statistics(stats)
+        if full_maintenance:
+            operations = MAINTENANCE_OPERATIONS
+        else:
+            operations = [
+                operation for operation, selected in (
+                    ('validate', validate_only),
+                    ('fix_missing', fix_missing),
+                    ('cleanup', cleanup),
+                ) if selected
+            ]
+
+        results = EmailIndexingService.run_maintenance(
+            operations=operations,
+            account_email=account_email,
+            batch_size=batch_size,
+            progress=None if quiet else self._report_progress
+        )
 
         # Summary
         if not quiet:
             self._print_summary(results)
 
+    def _report_progress(self, operation, results):
+        """Print a start message before, and the results after, each operation"""
+        if results is None:
+            self.stdout.write({
+                'validate': 'Validating email index...',
+                'fix_missing': 'Fixing missing index entries...',
+                'cleanup': 'Cleaning up orphaned email addresses...',
+                'statistics': 'Getting final index statistics...',
+            }[operation])
+            return
+
+        {
+            'validate': self._print_validation_results,
+            'fix_missing': self._print_fix_results,
+            'cleanup': self._print_cleanup_results,
+            'statistics': self._print_statistics,
+        }[operation](results)
+
     def _print_validation_results(self, results):
         """Print validation results"""
         self.stdout.write(f'Total messages: {results["total_messages"]}')
@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
 from rich.console import Console
-from google_email_indexer.models import GoogleMailMessage
+from google_email_indexer.models import GoogleMailMessage, message_id_from_raw
 from tqdm import tqdm
 
 console = Console()
@@ -25,16 +25,17 @@ class Command(BaseCommand):
         if update_all:
             console.print("[yellow]Mode:[/yellow] Full update (all fields)")
             # Get all messages
-            messages = GoogleMailMessage.objects.all()
+            messages = GoogleMailMessage.objects.select_related('raw_body').only('original_message_id', 'raw_body__raw')
         else:
             console.print("[yellow]Mode:[/yellow] Incremental update (changed fields only)")
             # Get only messages with missing values
-            messages = GoogleMailMessage.objects.filter(original_message_id=None)
+            messages = GoogleMailMessage.objects.select_related('raw_body').only(
+                'original_message_id', 'raw_body__raw'
+            ).filter(original_message_id=None)
         
         updated_count = 0
         for message in tqdm(messages):
-            mbox_message = message.mbox
-            message.original_message_id = mbox_message.get("Message-ID")
+            message.original_message_id = message_id_from_raw(bytes(message.raw or b""))
             updated_count += 1
         
         # Use bulk_update with the list of updated model instances
@@ -1,16 +1,16 @@
-import os
+from pathlib import Path
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from rich.console import Console
-from rich.table import Table
-
-console = Console()
 
 
 class Command(BaseCommand):
     help = "Show current Google API configuration"
 
     def handle(self, *args, **kwargs):
+        from rich.console import Console
+        from rich.table import Table
+
+        console = Console()
         console.print("[bold blue]Google API Configuration[/bold blue]")
         console.print("=" * 40)
         
@@ -22,12 +22,14 @@ class Command(BaseCommand):
         
         # Check credentials file
         creds_file = settings.GOOGLE_CREDENTIALS_FILE
-        creds_exists = os.path.exists(creds_file)
+        creds_path = Path(creds_file)
+        creds_exists = creds_path.is_file()
         creds_status = "✓ Found" if creds_exists else "✗ Missing"
         
         # Check token file  
         token_file = settings.GOOGLE_TOKEN_FILE
-        token_exists = os.path.exists(token_file)
+        token_path = Path(token_file)
+        token_exists = token_path.is_file()
         token_status = "✓ Found" if token_exists else "✗ Not created yet"
         
         table.add_row("GOOGLE_CREDENTIALS_FILE", creds_file, creds_status)
@@ -37,8 +39,8 @@ class Command(BaseCommand):
         
         # Show file paths
         console.print(f"\n[bold]File Paths:[/bold]")
-        console.print(f"  Credentials: {os.path.abspath(creds_file)}")
-        console.print(f"  Token: {os.path.abspath(token_file)}")
+        console.print(f"  Credentials: {creds_path.absolute()}")
+        console.print(f"  Token: {token_path.absolute()}")
         
         # Show status and next steps
         if not creds_exists:
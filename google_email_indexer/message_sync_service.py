@@ -1,16 +1,74 @@
-import base64
 import logging
-from typing import List, Optional, Dict, Any
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.header import Header
+from email.utils import formataddr, getaddresses
+from typing import TYPE_CHECKING, List, Optional, Dict, Any
 from django.conf import settings
-from django.db import transaction
+from django.db import connections, transaction
 from django.utils import timezone
-from mailbox import Message
 
-from .models import GoogleMailMessage, SyncState
-from .service import GoogleEmailService
+try:
+    import pybase64 as base64
+except ImportError:  # Optional, installed with the "fast" extra
+    import base64
+
+try:
+    from django_bulk_load import bulk_upsert_models
+except ImportError:  # Optional, installed with the "postgres" extra
+    bulk_upsert_models = None
+
+from .models import GoogleMailMessage, GoogleMailMessageRaw, SyncState, message_id_from_raw
+
+if TYPE_CHECKING:
+    from .service import GoogleEmailService
 
 logger = logging.getLogger(__name__)
 
+# Message fields written from Gmail data, i.e. everything refreshed when an
+# already stored message is downloaded again
+SYNCED_MESSAGE_FIELDS = [
+    'history_id',
+    'thread_id',
+    'snippet',
+    'label_ids',
+    'original_message_id',
+    'internal_date',
+    'size_estimate',
+    'is_read',
+    'is_starred',
+    'is_important',
+    'system_flags',
+    'updated_at',
+]
+
+# Message fields refreshed when only the labels of a message changed
+LABEL_MESSAGE_FIELDS = [
+    'label_ids',
+    'history_id',
+    'is_read',
+    'is_starred',
+    'is_important',
+    'system_flags',
+    'updated_at',
+]
+
+# Headers requested when message bodies are not downloaded (GMAIL_DOWNLOAD_BODY = False)
+METADATA_HEADERS = ['From', 'To', 'Cc', 'Subject', 'Date', 'Message-ID', 'Content-Type']
+
+# Headers holding addresses, whose display names are encoded separately from the addresses
+ADDRESS_HEADERS = {'from', 'to', 'cc', 'bcc', 'reply-to', 'sender'}
+
+# Number of full-sync batches being downloaded while the next page is listed
+SYNC_PIPELINE_DEPTH = 2
+
+# How long the label list of an account is reused before Gmail is asked again
+LABEL_CACHE_TTL = 300
+
+# Label lists per account email, as (fetched_at, labels, label IDs by lowercased name)
+_label_list_cache: Dict[str, tuple] = {}
+
 
 class MessageSyncService:
     """
@@ -23,10 +81,19 @@ class MessageSyncService:
     4. Batch processing for performance
     """
     
-    def __init__(self, gmail_service: Optional[GoogleEmailService] = None, account_email_override: Optional[str] = None):
-        self.gmail_service = gmail_service or GoogleEmailService()
+    def __init__(self, gmail_service: Optional['GoogleEmailService'] = None, account_email_override: Optional[str] = None):
+        if gmail_service is None:
+            # Imported here so the Google client libraries are only loaded when needed
+            from .service import GoogleEmailService
+            gmail_service = GoogleEmailService()
+        self.gmail_service = gmail_service
         self._current_account_email = None
+        self._profile_cache: Optional[Dict[str, Any]] = None
         self._account_email_override = account_email_override
+        # Header-only indexers can skip downloading message bodies
+        self.download_body = getattr(settings, 'GMAIL_DOWNLOAD_BODY', True)
+        # Rows per INSERT/UPDATE statement in bulk writes
+        self.bulk_batch_size = getattr(settings, 'INDEXER_BULK_BATCH_SIZE', 500)
         
     @property
     def current_account_email(self) -> Optional[str]:
@@ -35,15 +102,25 @@ class MessageSyncService:
         if self._account_email_override:
             return self._account_email_override
             
-        # Otherwise, lazy-load from Gmail profile if not already cached
+        # Otherwise use the email resolved for these credentials on an earlier run,
+        # and only fall back to fetching the Gmail profile if there is none
+        if self._current_account_email is None:
+            self._current_account_email = self.gmail_service.get_cached_account_email()
+        
         if self._current_account_email is None:
             try:
-                profile = self.gmail_service.get_profile()
-                self._current_account_email = profile.get('emailAddress')
+                self._current_account_email = self._get_profile().get('emailAddress')
             except Exception as e:
-                logger.error(f"Failed to get Gmail profile: {e}")
+                logger.error("Failed to get Gmail profile: %s", e)
                 return None
+            self.gmail_service.cache_account_email(self._current_account_email)
         return self._current_account_email
+    
+    def _get_profile(self) -> Dict[str, Any]:
+        """Get the Gmail profile, fetching it at most once per service instance."""
+        if self._profile_cache is None:
+            self._profile_cache = self.gmail_service.get_profile()
+        return self._profile_cache
         
     def sync_messages(self, max_results: int = 100, force_full_sync: bool = False, 
                      label_ids: Optional[List[str]] = None, label_names: Optional[List[str]] = None) -> Dict[str, Any]:
@@ -59,78 +136,114 @@ class MessageSyncService:
         Returns:
             Dict with sync statistics and information
         """
-        # Ensure we have the current account email
-        if not self.current_account_email:
+        # Resolve the account once; it is passed down explicitly from here
+        account_email = self.current_account_email
+        if not account_email:
             raise ValueError("Unable to determine current Gmail account email")
             
         # Convert label names to IDs
         resolved_label_ids = self._resolve_label_filters(label_ids, label_names)
         
-        last_history_id = self._get_last_history_id()
+        last_history_id = self._get_last_history_id(account_email)
         
         if force_full_sync or not last_history_id:
-            logger.info(f"Performing full sync for {self.current_account_email}{' with labels: ' + str(resolved_label_ids) if resolved_label_ids else ''}")
-            return self._full_sync(max_results, resolved_label_ids)
+            logger.info("Performing full sync for %s with labels: %s", account_email, resolved_label_ids)
+            return self._full_sync(account_email, max_results, resolved_label_ids)
         else:
-            logger.info(f"Attempting incremental sync for {self.current_account_email} from history ID: {last_history_id}{' with labels: ' + str(resolved_label_ids) if resolved_label_ids else ''}")
-            incremental_result = self._incremental_sync(last_history_id, resolved_label_ids)
+            logger.info("Attempting incremental sync for %s from history ID: %s with labels: %s",
+                        account_email, last_history_id, resolved_label_ids)
+            incremental_result = self._incremental_sync(account_email, last_history_id, resolved_label_ids)
             
             if incremental_result is None:
-                logger.warning(f"Incremental sync failed for {self.current_account_email}, falling back to full sync")
-                return self._full_sync(max_results, resolved_label_ids)
+                logger.warning("Incremental sync failed for %s, falling back to full sync", account_email)
+                return self._full_sync(account_email, max_results, resolved_label_ids)
             
             return incremental_result
     
-    def _full_sync(self, max_results: int, label_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    def _full_sync(self, account_email: str, max_results: int, label_ids: Optional[List[str]] = None) -> Dict[str, Any]:
         """
         Perform a full synchronization of messages.
         
         This downloads the most recent messages and stores the latest history ID
         for future incremental syncs.
         """
-        logger.info(f"Starting full sync with max_results={max_results}")
+        logger.info("Starting full sync with max_results=%s", max_results)
         
-        # Get list of message IDs, optionally filtered by labels
-        messages = self.gmail_service.list_messages(max_results=max_results, label_ids=label_ids)
+        # The history ID is taken before listing: changes made while the sync
+        # runs are then replayed by the next incremental sync instead of being
+        # skipped. This reuses the profile if it was fetched for the account email.
+        latest_history_id = self._get_profile().get('historyId')
         
         stats = {
             'sync_type': 'full',
             'label_filter': label_ids,
-            'total_found': len(messages),
+            'total_found': 0,
             'new_messages': 0,
             'updated_messages': 0,
             'errors': [],
             'history_id': None
         }
         
-        # Process messages in batches for better performance
-        batch_size = 50
-        for i in range(0, len(messages), batch_size):
-            print(f"Processing batch {i} of {len(messages)}")
-            batch = messages[i:i + batch_size]
-            batch_stats = self._process_message_batch(batch, force_update=False)
-            
+        # Message IDs are listed page by page and processed as a pipeline: while
+        # up to SYNC_PIPELINE_DEPTH batches are being downloaded from Gmail, the
+        # next page is listed and finished batches are written with one bulk
+        # upsert each. Database access stays on this thread.
+        batch_size = getattr(settings, 'GMAIL_SYNC_BATCH_SIZE', 500)
+        pages = self.gmail_service.iter_message_ids(
+            max_results=max_results, label_ids=label_ids, page_size=batch_size
+        )
+        in_flight = deque()
+        
+        def store_oldest():
+            existing_ids, to_download, download = in_flight.popleft()
+            try:
+                message_data_list, fetch_errors = download.result()
+            except Exception as e:
+                # A failed batch request fails its messages, the other batches carry on
+                logger.error("Error downloading batch of %d messages: %s", len(to_download), e)
+                message_data_list, fetch_errors = [], dict.fromkeys(to_download, e)
+            batch_stats = self._store_downloaded_messages(account_email, message_data_list, fetch_errors, existing_ids)
             stats['new_messages'] += batch_stats['new_messages']
             stats['updated_messages'] += batch_stats['updated_messages']
             stats['errors'].extend(batch_stats['errors'])
         
-        # Store the latest history ID from the profile for future incremental syncs
-        profile = self.gmail_service.get_profile()
-        latest_history_id = profile.get('historyId')
+        with ThreadPoolExecutor(max_workers=SYNC_PIPELINE_DEPTH) as executor:
+            for batch in self._iter_id_batches(pages, batch_size):
+                logger.info("Processing batch starting at %d (%d messages)", stats['total_found'], len(batch))
+                stats['total_found'] += len(batch)
+                existing_ids, to_download = self._split_existing(account_email, batch, force_update=False)
+                
+                if len(in_flight) >= SYNC_PIPELINE_DEPTH:
+                    store_oldest()
+                in_flight.append((
+                    existing_ids,
+                    to_download,
+                    executor.submit(self.gmail_service.batch_get_messages, to_download, **self._message_format_kwargs())
+                ))
+            
+            while in_flight:
+                store_oldest()
+        
+        # Store the history ID from the profile for future incremental syncs
         if latest_history_id:
-            self._store_last_history_id(latest_history_id)
+            self._store_last_history_id(account_email, latest_history_id)
             stats['history_id'] = latest_history_id
         
-        logger.info(f"Full sync completed: {stats}")
+        stats['errors'] = self._format_errors(stats['errors'])
+        logger.info("Full sync completed: %s", stats)
         return stats
     
-    def _incremental_sync(self, start_history_id: str, label_ids: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    def _incremental_sync(self, account_email: str, start_history_id: str,
+                          label_ids: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
         """
         Perform incremental sync using Gmail's History API.
         
-        Returns None if history ID is too old and full sync is needed.
+        Returns None if the history could not be listed (e.g. the history ID is
+        too old) and full sync is needed. Once the history is listed, failures
+        while applying it are reported in the stats instead, and the stored
+        history ID is left alone so the next sync replays the same changes.
         """
-        logger.info(f"Starting incremental sync from history ID: {start_history_id}")
+        logger.info("Starting incremental sync from history ID: %s", start_history_id)
         
         try:
             # Get history changes since last sync
@@ -143,224 +256,483 @@ class MessageSyncService:
                 history_types=['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved'],
                 label_id=label_id_filter
             )
-            
-            if history_result is None:
-                return None  # History too old, need full sync
-            
-            history_records = history_result.get('history', [])
-            current_history_id = history_result.get('historyId')
-            
-            stats = {
-                'sync_type': 'incremental',
-                'label_filter': label_ids,
-                'history_records': len(history_records),
-                'messages_added': 0,
-                'messages_deleted': 0,
-                'labels_modified': 0,
-                'errors': [],
-                'history_id': current_history_id
-            }
-            
-            # Process each history record
-            for record in history_records:
-                record_stats = self._process_history_record(record, label_ids)
-                
-                stats['messages_added'] += record_stats['messages_added']
-                stats['messages_deleted'] += record_stats['messages_deleted']
-                stats['labels_modified'] += record_stats['labels_modified']
-                stats['errors'].extend(record_stats['errors'])
-            
-            # Update stored history ID
-            if current_history_id:
-                self._store_last_history_id(current_history_id)
-            
-            logger.info(f"Incremental sync completed: {stats}")
-            return stats
-            
         except Exception as e:
-            logger.error(f"Incremental sync failed: {e}")
+            logger.error("Incremental sync failed: %s", e)
             return None
-    
-    def _process_history_record(self, record: Dict[str, Any], label_ids: Optional[List[str]] = None) -> Dict[str, Any]:
-        """Process a single history record and update local messages accordingly."""
+        
+        if history_result is None:
+            return None  # History too old, need full sync
+        
+        history_records = history_result.get('history', [])
+        current_history_id = history_result.get('historyId')
+        
         stats = {
+            'sync_type': 'incremental',
+            'label_filter': label_ids,
+            'history_records': len(history_records),
             'messages_added': 0,
             'messages_deleted': 0,
+            'labels_modified': 0,
+            'errors': [],
+            'history_id': current_history_id
+        }
+        
+        # Collect the changes from every history record, then apply them in one pass per type
+        changes = {
+            'added_ids': [],
+            'deleted_ids': [],
+            'label_changed_ids': [],
+        }
+        # Built once, so matching an added message is a single set test
+        label_filter = set(label_ids) if label_ids else None
+        for record in history_records:
+            record_stats = self._process_history_record(record, label_filter, changes)
+            
+            stats['labels_modified'] += record_stats['labels_modified']
+            stats['errors'].extend(record_stats['errors'])
+        
+        apply_stats = self._apply_history_changes(account_email, changes)
+        stats['messages_added'] += apply_stats['messages_added']
+        stats['messages_deleted'] += apply_stats['messages_deleted']
+        stats['errors'].extend(apply_stats['errors'])
+        
+        # Only move past these changes once all of them were applied
+        if not apply_stats['complete']:
+            logger.warning("Incremental sync for %s was incomplete, keeping history ID %s",
+                           account_email, start_history_id)
+            stats['history_id'] = start_history_id
+        elif current_history_id:
+            self._store_last_history_id(account_email, current_history_id)
+        
+        stats['errors'] = self._format_errors(stats['errors'])
+        logger.info("Incremental sync completed: %s", stats)
+        return stats
+    
+    def _process_history_record(self, record: Dict[str, Any], label_filter: Optional[set],
+                                changes: Dict[str, List[str]]) -> Dict[str, Any]:
+        """
+        Collect the changes from a single history record into `changes`.
+
+        Added messages are only collected if they carry at least one label of
+        label_filter (None means no filter).
+
+        Nothing is downloaded or written here; see _apply_history_changes.
+        """
+        stats = {
             'labels_modified': 0,
             'errors': []
         }
         
         try:
-            # Handle added messages
-            for msg_added in record.get('messagesAdded', []):
-                message_id = msg_added['message']['id']
+            # Collect added messages that match the label filter (if any)
+            changes['added_ids'].extend(
+                msg_added['message']['id'] for msg_added in record.get('messagesAdded', [])
+                if label_filter is None or not label_filter.isdisjoint(msg_added['message'].get('labelIds', []))
+            )
+            
+            # Collect deleted messages
+            changes['deleted_ids'].extend(
+                msg_deleted['message']['id'] for msg_deleted in record.get('messagesDeleted', [])
+            )
+            
+            # Collect label changes
+            label_changes = record.get('labelsAdded', []) + record.get('labelsRemoved', [])
+            stats['labels_modified'] += len(label_changes)
+            changes['label_changed_ids'].extend(
+                label_change['message']['id'] for label_change in label_changes
+            )
+        
+        except Exception as e:
+            stats['errors'].append(("Failed to process history record: %s", e))
+        
+        return stats
+    
+    def _apply_history_changes(self, account_email: str, changes: Dict[str, List[str]]) -> Dict[str, Any]:
+        """
+        Apply changes collected from history records, with one batched operation per change type.
+
+        Each change type is applied on its own, so a failure in one does not
+        lose the others; stats['complete'] is False if any of them failed.
+        """
+        stats = {
+            'messages_added': 0,
+            'messages_deleted': 0,
+            'errors': [],
+            'complete': True
+        }
+        
+        # A message can appear in several records; handle each one once. Deleted
+        # messages need nothing else, and added messages are downloaded with
+        # their current labels anyway. dict.fromkeys keeps the history order.
+        deleted_ids = list(dict.fromkeys(changes['deleted_ids']))
+        handled_ids = set(deleted_ids)
+        added_ids = [
+            message_id for message_id in dict.fromkeys(changes['added_ids'])
+            if message_id not in handled_ids
+        ]
+        handled_ids.update(added_ids)
+        label_changed_ids = [
+            message_id for message_id in dict.fromkeys(changes['label_changed_ids'])
+            if message_id not in handled_ids
+        ]
+        
+        # Delete removed messages with a single query
+        if deleted_ids:
+            try:
+                _, deleted_per_model = GoogleMailMessage.objects.filter(
+                    account_email=account_email,
+                    message_id__in=deleted_ids
+                ).delete()
+                stats['messages_deleted'] += deleted_per_model.get(GoogleMailMessage._meta.label, 0)
+            except Exception as e:
+                stats['errors'].append(("Failed to delete messages %s: %s", ', '.join(deleted_ids), e))
+                stats['complete'] = False
+        
+        # Download added messages through the batched download path
+        if added_ids:
+            try:
+                batch_stats = self._process_message_batch(
+                    account_email, [{'id': message_id} for message_id in added_ids], force_update=True
+                )
+                stats['messages_added'] += batch_stats['new_messages'] + batch_stats['updated_messages']
+                stats['errors'].extend(batch_stats['errors'])
+                stats['complete'] &= not batch_stats['store_failed']
+            except Exception as e:
+                stats['errors'].append(("Failed to add messages %s: %s", ', '.join(added_ids), e))
+                stats['complete'] = False
+        
+        # Refresh labels for affected messages with one Gmail batch and one bulk update
+        if label_changed_ids:
+            try:
+                local_messages = {
+                    message.message_id: message
+                    for message in GoogleMailMessage.objects.filter(
+                        account_email=account_email,
+                        message_id__in=label_changed_ids
+                    ).only('pk', 'message_id', *LABEL_MESSAGE_FIELDS)
+                }
+            except Exception as e:
+                stats['errors'].append(("Failed to update labels for %s: %s", ', '.join(label_changed_ids), e))
+                stats['complete'] = False
+                return stats
+            
+            # Messages we don't have locally are downloaded in full
+            missing_ids = [message_id for message_id in label_changed_ids if message_id not in local_messages]
+            if missing_ids:
                 try:
-                    # Check if message matches label filter (if any)
-                    if self._message_matches_labels(msg_added['message'], label_ids):
-                        self._download_and_store_message(message_id)
-                        stats['messages_added'] += 1
+                    batch_stats = self._process_message_batch(
+                        account_email, [{'id': message_id} for message_id in missing_ids]
+                    )
+                    stats['errors'].extend(batch_stats['errors'])
+                    stats['complete'] &= not batch_stats['store_failed']
                 except Exception as e:
-                    stats['errors'].append(f"Failed to add message {message_id}: {e}")
+                    stats['errors'].append(("Failed to add messages %s: %s", ', '.join(missing_ids), e))
+                    stats['complete'] = False
             
-            # Handle deleted messages
-            for msg_deleted in record.get('messagesDeleted', []):
-                message_id = msg_deleted['message']['id']
+            if local_messages:
                 try:
-                    GoogleMailMessage.objects.filter(
-                        message_id=message_id, 
-                        account_email=self.current_account_email
-                    ).delete()
-                    stats['messages_deleted'] += 1
+                    message_meta_list, fetch_errors = self.gmail_service.batch_get_messages(
+                        list(local_messages), format="minimal"
+                    )
                 except Exception as e:
-                    stats['errors'].append(f"Failed to delete message {message_id}: {e}")
-            
-            # Handle label changes
-            label_changes = len(record.get('labelsAdded', [])) + len(record.get('labelsRemoved', []))
-            if label_changes > 0:
-                stats['labels_modified'] += label_changes
-                # Update labels for affected messages
-                for label_change in record.get('labelsAdded', []) + record.get('labelsRemoved', []):
-                    message_id = label_change['message']['id']
-                    try:
-                        self._update_message_labels(message_id)
-                    except Exception as e:
-                        stats['errors'].append(f"Failed to update labels for {message_id}: {e}")
-        
-        except Exception as e:
-            stats['errors'].append(f"Failed to process history record: {e}")
+                    stats['errors'].append(("Failed to update labels for %s: %s", ', '.join(local_messages), e))
+                    stats['complete'] = False
+                    return stats
+                
+                for message_id, e in fetch_errors.items():
+                    stats['errors'].append(("Failed to update labels for %s: %s", message_id, e))
+                
+                now = timezone.now()
+                updated_messages = []
+                for message_meta in message_meta_list:
+                    message = local_messages[message_meta['id']]
+                    message.label_ids = message_meta.get("labelIds", [])
+                    message.history_id = message_meta.get("historyId")
+                    message.update_flags_from_labels()
+                    message.updated_at = now
+                    updated_messages.append(message)
+                
+                try:
+                    GoogleMailMessage.objects.bulk_update(updated_messages, LABEL_MESSAGE_FIELDS, batch_size=self.bulk_batch_size)
+                except Exception as e:
+                    stats['errors'].append(("Failed to update labels for %s: %s", ', '.join(local_messages), e))
+                    stats['complete'] = False
         
         return stats
     
-    def _process_message_batch(self, message_batch: List[Dict], force_update: bool = False) -> Dict[str, Any]:
-        """Process a batch of messages for downloading and storage."""
+    @staticmethod
+    def _format_errors(errors: List[tuple]) -> List[str]:
+        """
+        Format collected errors for the sync result.
+
+        Errors are collected as (message, *args) tuples in %-style, like logging
+        calls, so that nothing is formatted per message on the sync's hot path.
+        """
+        return [error[0] % error[1:] for error in errors]
+    
+    @staticmethod
+    def _iter_id_batches(pages, batch_size: int):
+        """Regroup pages of message stubs into lists of at most batch_size message IDs."""
+        buffer = []
+        for page in pages:
+            buffer.extend(message_info['id'] for message_info in page)
+            while len(buffer) >= batch_size:
+                yield buffer[:batch_size]
+                buffer = buffer[batch_size:]
+        if buffer:
+            yield buffer
+    
+    def _process_message_batch(self, account_email: str, message_batch: List[Dict],
+                               force_update: bool = False) -> Dict[str, Any]:
+        """
+        Process a batch of messages for downloading and storage.
+
+        Existing messages are looked up with a single query, the remaining
+        messages are downloaded and then written with one bulk upsert.
+        """
+        message_ids = [message_info['id'] for message_info in message_batch]
+        existing_ids, to_download = self._split_existing(account_email, message_ids, force_update)
+        
+        message_data_list, fetch_errors = [], {}
+        if to_download:
+            message_data_list, fetch_errors = self.gmail_service.batch_get_messages(
+                to_download, **self._message_format_kwargs()
+            )
+        
+        return self._store_downloaded_messages(account_email, message_data_list, fetch_errors, existing_ids)
+    
+    def _split_existing(self, account_email: str, message_ids: List[str], force_update: bool):
+        """Return the IDs already stored for this account and the IDs that need downloading."""
+        existing_ids = set(
+            GoogleMailMessage.objects.filter(
+                account_email=account_email,
+                message_id__in=message_ids
+            ).values_list('message_id', flat=True)
+        )
+        to_download = [
+            message_id for message_id in message_ids
+            if force_update or message_id not in existing_ids
+        ]
+        return existing_ids, to_download
+    
+    def _store_downloaded_messages(self, account_email: str, message_data_list: List[Dict],
+                                   fetch_errors: Dict[str, Exception], existing_ids: set) -> Dict[str, Any]:
+        """
+        Build and bulk-store downloaded format=raw messages, counting new and updated ones.
+
+        stats['store_failed'] is True if the bulk write failed, in which case
+        none of the messages were stored.
+        """
         stats = {
             'new_messages': 0,
             'updated_messages': 0,
-            'errors': []
+            'errors': [],
+            'store_failed': False
         }
         
-        for message_info in message_batch:
-            message_id = message_info['id']
-            
+        for message_id, e in fetch_errors.items():
+            stats['errors'].append(("Failed to process message %s: %s", message_id, e))
+            logger.error("Error processing message %s: %s", message_id, e)
+        
+        messages = []
+        for message_data in message_data_list:
+            message_id = message_data.get("id")
             try:
-                # Check if message already exists
-                existing_message = None
-                if not force_update:
-                    try:
-                        existing_message = GoogleMailMessage.objects.get(
-                            message_id=message_id,
-                            account_email=self.current_account_email
-                        )
-                    except GoogleMailMessage.DoesNotExist:
-                        pass
-                
-                if existing_message is None or force_update:
-                    self._download_and_store_message(message_id)
-                    if existing_message is None:
-                        stats['new_messages'] += 1
-                    else:
-                        stats['updated_messages'] += 1
-                        
+                messages.append(self._build_model(account_email, self._decode_payload(message_data)))
             except Exception as e:
-                stats['errors'].append(f"Failed to process message {message_id}: {e}")
-                logger.error(f"Error processing message {message_id}: {e}")
+                stats['errors'].append(("Failed to process message %s: %s", message_id, e))
+                logger.error("Error processing message %s: %s", message_id, e)
+        
+        if messages:
+            try:
+                self._store_messages(messages)
+            except Exception as e:
+                # The bulk write is atomic, so none of the batch's messages were stored
+                logger.error("Error storing batch of %d messages: %s", len(messages), e)
+                for message in messages:
+                    stats['errors'].append(("Failed to store message %s: %s", message.message_id, e))
+                stats['store_failed'] = True
+                messages = []
+        
+        for message in messages:
+            if message.message_id in existing_ids:
+                stats['updated_messages'] += 1
+            else:
+                stats['new_messages'] += 1
         
         return stats
     
-    def _download_and_store_message(self, message_id: str) -> GoogleMailMessage:
-        """Download a message from Gmail and store it in the database."""
-        # Get the full message data
-        message_data = self.gmail_service.get_message(message_id, format="raw")
-        raw = base64.urlsafe_b64decode(message_data.get("raw").encode("ASCII"))
-        
-        # Get additional metadata with minimal format for efficiency
-        message_meta = self.gmail_service.get_message(message_id, format="minimal")
+    def _message_format_kwargs(self, fetch_body: Optional[bool] = None) -> Dict[str, Any]:
+        """Gmail request arguments for downloading messages, with or without their body."""
+        if fetch_body is None:
+            fetch_body = self.download_body
+        if fetch_body:
+            return {'format': 'raw'}
+        return {'format': 'metadata', 'metadata_headers': METADATA_HEADERS}
+    
+    def _fetch_message_payload(self, message_id: str, fetch_body: Optional[bool] = None) -> Dict[str, Any]:
+        """Download a message from Gmail, returning the decoded raw bytes and its metadata."""
+        return self._decode_payload(
+            self.gmail_service.get_message(message_id, **self._message_format_kwargs(fetch_body))
+        )
+    
+    @staticmethod
+    def _decode_payload(message_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Decode a format=raw or format=metadata message resource into a payload.
 
-        # Parse mbox message
-        mbox_message = Message(raw)
-        
-        # Create or update the message
-        with transaction.atomic():
-            message, created = GoogleMailMessage.objects.get_or_create(
-                message_id=message_id,
-                account_email=self.current_account_email,
-                defaults={
-                    "history_id": message_meta.get("historyId"),
-                    "thread_id": message_meta.get("threadId"),
-                    "snippet": message_meta.get("snippet", ""),
-                    "label_ids": message_meta.get("labelIds", []),
-                    "raw": raw,
-                    "original_message_id": mbox_message.get("Message-ID"),
-                    "internal_date": message_meta.get("internalDate"),
-                    "size_estimate": message_meta.get("sizeEstimate"),
-                }
-            )
-            
-            if not created:
-                # Update existing message
-                message.history_id = message_meta.get("historyId")
-                message.thread_id = message_meta.get("threadId")
-                message.snippet = message_meta.get("snippet", "")
-                message.label_ids = message_meta.get("labelIds", [])
-                message.raw = raw
-                message.original_message_id = mbox_message.get("Message-ID")
-                message.internal_date = message_meta.get("internalDate")
-                message.size_estimate = message_meta.get("sizeEstimate")
-                message.save()
-            
-            # Update flags based on labels
-            message.update_flags_from_labels()
-            message.save()
+        The response already carries historyId, threadId, labelIds, snippet,
+        internalDate and sizeEstimate, so it doubles as the message metadata.
+        For format=metadata the raw content is rebuilt from the returned headers
+        alone, giving a message without body that the header fields can parse.
+        """
+        if "raw" in message_data:
+            raw = base64.urlsafe_b64decode(message_data["raw"].encode("ASCII"))
+        else:
+            headers = message_data.get("payload", {}).get("headers", [])
+            raw = "".join(
+                MessageSyncService._header_line(header['name'], header['value']) for header in headers
+            ).encode("ascii") + b"\r\n"
+        return {"raw": raw, "meta": message_data}
+    
+    @staticmethod
+    def _header_line(name: str, value: str) -> str:
+        """
+        A header line for a rebuilt message, RFC 2047-encoding non-ASCII values.
+
+        Gmail returns header values as unicode; written out as 8-bit bytes they
+        would be parsed back as Header objects instead of strings.
+        """
+        if not value.isascii():
+            if name.lower() in ADDRESS_HEADERS:
+                try:
+                    value = ", ".join(formataddr(pair, "utf-8") for pair in getaddresses([value]))
+                except UnicodeEncodeError:
+                    # Non-ASCII in the address itself, which formataddr cannot encode
+                    value = Header(value, "utf-8", header_name=name).encode(linesep="\r\n")
+            else:
+                value = Header(value, "utf-8", header_name=name).encode(linesep="\r\n")
+        return f"{name}: {value}\r\n"
+    
+    def _build_model(self, account_email: str, payload: Dict[str, Any]) -> GoogleMailMessage:
+        """Build an unsaved GoogleMailMessage from a downloaded payload, without touching the database."""
+        raw = payload["raw"]
+        message_meta = payload["meta"]
         
+        message = GoogleMailMessage(
+            message_id=message_meta.get("id"),
+            account_email=account_email,
+            history_id=message_meta.get("historyId"),
+            thread_id=message_meta.get("threadId"),
+            snippet=message_meta.get("snippet", ""),
+            label_ids=message_meta.get("labelIds", []),
+            raw=raw,
+            # Only the header block is parsed here; the MIME tree is parsed on demand
+            original_message_id=message_id_from_raw(raw),
+            internal_date=message_meta.get("internalDate"),
+            size_estimate=message_meta.get("sizeEstimate"),
+        )
+        message.update_flags_from_labels()
         return message
     
-    def _update_message_labels(self, message_id: str):
-        """Update labels for an existing message."""
-        try:
-            message = GoogleMailMessage.objects.get(
-                message_id=message_id,
-                account_email=self.current_account_email
+    def _download_and_store_message(self, message_id: str, *, fetch_body: Optional[bool] = None) -> GoogleMailMessage:
+        """
+        Download a message from Gmail and store it in the database with a single write.
+
+        fetch_body defaults to the GMAIL_DOWNLOAD_BODY setting.
+        """
+        message = self._build_model(self.current_account_email, self._fetch_message_payload(message_id, fetch_body))
+        self._store_messages([message])
+        return message
+    
+    def _store_messages(self, messages: List[GoogleMailMessage]):
+        """
+        Insert or update messages and their raw content with INSERT ... ON CONFLICT DO UPDATE.
+
+        Relies on the unique (account_email, message_id) constraint, so no prior
+        SELECT is needed and concurrent syncs of the same message cannot race.
+        """
+        with transaction.atomic():
+            self._upsert(
+                GoogleMailMessage, messages, ['account_email', 'message_id'], SYNCED_MESSAGE_FIELDS
             )
-            message_meta = self.gmail_service.get_message(message_id, format="minimal")
             
-            message.label_ids = message_meta.get("labelIds", [])
-            message.history_id = message_meta.get("historyId")
-            message.update_flags_from_labels()
-            message.save()
+            # Backends that can't return ids from an upsert leave pk unset
+            if any(message.pk is None for message in messages):
+                pks = dict(
+                    GoogleMailMessage.objects.filter(
+                        account_email=messages[0].account_email,
+                        message_id__in=[message.message_id for message in messages]
+                    ).values_list('message_id', 'pk')
+                )
+                for message in messages:
+                    message.pk = pks[message.message_id]
             
-        except GoogleMailMessage.DoesNotExist:
-            # Message doesn't exist locally, download it
-            self._download_and_store_message(message_id)
+            # The raw rows were built before their message had a pk. bulk_create
+            # would fix up the foreign key itself, COPY writes it as it is
+            raw_bodies = []
+            for message in messages:
+                message.raw_body.message = message
+                raw_bodies.append(message.raw_body)
+            self._upsert(GoogleMailMessageRaw, raw_bodies, ['message'], ['raw'])
+
+    def _upsert(self, model, objs: List[Any], unique_fields: List[str], update_fields: List[str]):
+        """
+        Insert objs, updating update_fields of the rows that already exist.
+
+        On PostgreSQL with django-bulk-load installed the rows are streamed with
+        COPY instead of INSERT statements. Neither way sets pk on existing rows.
+        """
+        if bulk_upsert_models is None or connections[model.objects.db].vendor != 'postgresql':
+            model.objects.bulk_create(
+                objs,
+                update_conflicts=True,
+                unique_fields=unique_fields,
+                update_fields=update_fields,
+                batch_size=self.bulk_batch_size,
+            )
+            return
+
+        insert_only_fields = []
+        for field in model._meta.concrete_fields:
+            if field.primary_key or field.name in unique_fields:
+                continue
+            # bulk_create sets auto_now(_add) timestamps, COPY leaves them to us
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                for obj in objs:
+                    field.pre_save(obj, add=True)
+            if field.name not in update_fields:
+                insert_only_fields.append(field.name)
+        bulk_upsert_models(
+            objs,
+            pk_field_names=unique_fields,
+            insert_only_field_names=insert_only_fields,
+        )
     
-    def _get_last_history_id(self) -> Optional[str]:
-        """Get the last stored history ID for incremental sync for the current account."""
-        if not self.current_account_email:
-            return None
-            
+    def _get_last_history_id(self, account_email: str) -> Optional[str]:
+        """Get the last stored history ID for incremental sync for the account."""
+        # Only the history ID column is read, not whole rows
+        last_history_id = SyncState.objects.filter(
+            account_email=account_email
+        ).values_list('last_history_id', flat=True).first()
+        if last_history_id is not None:
+            return last_history_id
+        
+        # Fallback: get from the most recent message for this account
         try:
-            sync_state = SyncState.objects.get(account_email=self.current_account_email)
-            return sync_state.last_history_id
-        except SyncState.DoesNotExist:
-            # Fallback: get from the most recent message for this account
-            try:
-                latest_message = GoogleMailMessage.objects.filter(
-                    account_email=self.current_account_email
-                ).order_by('-internal_date').first()
-                return latest_message.history_id if latest_message else None
-            except Exception:
-                return None
+            return GoogleMailMessage.objects.filter(
+                account_email=account_email
+            ).order_by('-internal_date').values_list('history_id', flat=True).first()
+        except Exception:
+            return None
     
-    def _store_last_history_id(self, history_id: str):
-        """Store the history ID for future incremental syncs for the current account."""
-        if not self.current_account_email:
-            logger.warning("Cannot store history ID: no current account email")
-            return
-            
+    def _store_last_history_id(self, account_email: str, history_id: str):
+        """Store the history ID for future incremental syncs for the account."""
         SyncState.objects.update_or_create(
-            account_email=self.current_account_email,
+            account_email=account_email,
             defaults={'last_history_id': history_id}
         )
-        logger.info(f"Stored history ID {history_id} for account {self.current_account_email}")
+        logger.info("Stored history ID %s for account %s", history_id, account_email)
     
     def force_resync_message(self, message_id: str) -> GoogleMailMessage:
         """Force re-download of a specific message."""
@@ -380,30 +752,40 @@ class MessageSyncService:
         if label_ids:
             resolved_ids.extend(label_ids)
         
-        # Convert label names to IDs
+        # Convert label names to IDs against a single fetch of the label list
         if label_names:
-            for label_name in label_names:
-                label = self.gmail_service.find_label_by_name(label_name)
-                if label:
-                    resolved_ids.append(label['id'])
-                    logger.info(f"Resolved label '{label_name}' to ID: {label['id']}")
-                else:
-                    logger.warning(f"Label '{label_name}' not found")
+            label_ids_by_name = self._get_label_cache()[2]
+            resolved = {
+                label_name: label_ids_by_name.get(label_name.lower()) for label_name in label_names
+            }
+            resolved_ids.extend(label_id for label_id in resolved.values() if label_id)
+            
+            missing = [label_name for label_name, label_id in resolved.items() if not label_id]
+            if missing:
+                logger.warning("Labels not found: %s", ", ".join(missing))
+            logger.info("Resolved labels: %s", resolved)
         
         return resolved_ids if resolved_ids else None
     
-    def _message_matches_labels(self, message: Dict[str, Any], label_ids: Optional[List[str]]) -> bool:
-        """Check if a message matches the label filter."""
-        if not label_ids:
-            return True  # No filter means all messages match
+    def _get_labels(self) -> List[Dict[str, Any]]:
+        """Get the account's labels, reusing a list fetched within LABEL_CACHE_TTL seconds."""
+        return self._get_label_cache()[1]
+    
+    def _get_label_cache(self) -> tuple:
+        """The account's _label_list_cache entry, refreshed once older than LABEL_CACHE_TTL seconds."""
+        account_email = self.current_account_email
+        cached = _label_list_cache.get(account_email)
+        if cached and time.monotonic() - cached[0] < LABEL_CACHE_TTL:
+            return cached
         
-        message_labels = message.get('labelIds', [])
-        # Check if any of the filter labels are in the message's labels
-        return any(label_id in message_labels for label_id in label_ids)
+        labels = self.gmail_service.list_labels()
+        label_ids_by_name = {label['name'].lower(): label['id'] for label in labels if label.get('name')}
+        cached = _label_list_cache[account_email] = (time.monotonic(), labels, label_ids_by_name)
+        return cached
     
     def list_available_labels(self) -> List[Dict[str, Any]]:
         """Get a list of all available labels with their metadata."""
-        labels = self.gmail_service.list_labels()
+        labels = self._get_labels()
         
         # Add message counts for each label
         enhanced_labels = []
@@ -425,6 +807,8 @@ class MessageSyncService:
 
 def display_sync_results(console, sync_result: dict, verbose: bool):
     """Display sync results in a formatted way."""
+    from rich.table import Table
+    
     sync_type = sync_result.get('sync_type', 'unknown')
     label_filter = sync_result.get('label_filter')
     
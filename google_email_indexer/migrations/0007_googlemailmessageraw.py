@@ -0,0 +1,53 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_raw_to_raw_table(apps, schema_editor):
+    GoogleMailMessage = apps.get_model('google_email_indexer', 'GoogleMailMessage')
+    GoogleMailMessageRaw = apps.get_model('google_email_indexer', 'GoogleMailMessageRaw')
+
+    batch = []
+    for message_pk, raw in GoogleMailMessage.objects.values_list('pk', 'raw').iterator(chunk_size=500):
+        batch.append(GoogleMailMessageRaw(message_id=message_pk, raw=raw))
+        if len(batch) >= 500:
+            GoogleMailMessageRaw.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        GoogleMailMessageRaw.objects.bulk_create(batch)
+
+
+def copy_raw_to_message_table(apps, schema_editor):
+    GoogleMailMessage = apps.get_model('google_email_indexer', 'GoogleMailMessage')
+    GoogleMailMessageRaw = apps.get_model('google_email_indexer', 'GoogleMailMessageRaw')
+
+    for message_pk, raw in GoogleMailMessageRaw.objects.values_list('message_id', 'raw').iterator(chunk_size=500):
+        GoogleMailMessage.objects.filter(pk=message_pk).update(raw=raw)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_email_indexer', '0006_googlemailmessage_original_message_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoogleMailMessageRaw',
+            fields=[
+                ('message', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='raw_body', serialize=False, to='google_email_indexer.googlemailmessage')),
+                ('raw', models.BinaryField()),
+            ],
+        ),
+        # Nullable while being removed, so that the column can be re-added
+        # empty and refilled when this migration is reversed
+        migrations.AlterField(
+            model_name='googlemailmessage',
+            name='raw',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.RunPython(copy_raw_to_raw_table, copy_raw_to_message_table),
+        migrations.RemoveField(
+            model_name='googlemailmessage',
+            name='raw',
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+INDEX_NAME = 'google_emai_label_ids_gin'
+
+
+def create_label_ids_index(apps, schema_editor):
+    # GIN indexes on jsonb only exist on PostgreSQL; other backends keep the
+    # fallback lookup in GoogleMailMessageQuerySet.with_any_label
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = apps.get_model('google_email_indexer', 'GoogleMailMessage')._meta.db_table
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON {schema_editor.quote_name(table)} '
+        'USING gin (label_ids jsonb_path_ops)'
+    )
+
+
+def drop_label_ids_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_email_indexer', '0007_googlemailmessageraw'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_label_ids_index, drop_label_ids_index),
+    ]
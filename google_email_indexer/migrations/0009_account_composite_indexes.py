@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-16 01:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_email_indexer', '0008_googlemailmessage_label_ids_gin'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='googlemailmessage',
+            name='unique_message_per_account',
+        ),
+        migrations.RemoveIndex(
+            model_name='googlemailmessage',
+            name='google_emai_account_e9fb91_idx',
+        ),
+        migrations.AddIndex(
+            model_name='googlemailmessage',
+            index=models.Index(fields=['account_email', '-internal_date'], name='idx_acct_date'),
+        ),
+        migrations.AddConstraint(
+            model_name='googlemailmessage',
+            constraint=models.UniqueConstraint(fields=('account_email', 'message_id'), name='unique_message_per_account'),
+        ),
+    ]
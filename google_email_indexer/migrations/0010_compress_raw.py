@@ -0,0 +1,66 @@
+import zlib
+
+from django.db import migrations
+
+import google_email_indexer.models
+
+# Frozen copy of the CompressedBinaryField format as of this migration
+MAGIC = b"\x00zlib:"
+ZSTD_MAGIC = b"\x00zstd:"
+MIN_COMPRESS_SIZE = 4096
+
+
+def compress(value):
+    value = bytes(value)
+    if len(value) < MIN_COMPRESS_SIZE:
+        return value
+    return MAGIC + zlib.compress(value)
+
+
+def decompress(value):
+    value = bytes(value)
+    if value.startswith(ZSTD_MAGIC):
+        # Only written by earlier versions of the field, which needed zstandard
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(value[len(ZSTD_MAGIC):])
+    if value.startswith(MAGIC):
+        return zlib.decompress(value[len(MAGIC):])
+    return value
+
+
+def _rewrite_raw(apps, convert):
+    GoogleMailMessageRaw = apps.get_model('google_email_indexer', 'GoogleMailMessageRaw')
+
+    batch = []
+    for message_pk, raw in GoogleMailMessageRaw.objects.values_list('message_id', 'raw').iterator(chunk_size=500):
+        batch.append(GoogleMailMessageRaw(message_id=message_pk, raw=convert(raw)))
+        if len(batch) >= 500:
+            GoogleMailMessageRaw.objects.bulk_update(batch, ['raw'])
+            batch = []
+    if batch:
+        GoogleMailMessageRaw.objects.bulk_update(batch, ['raw'])
+
+
+def compress_raw(apps, schema_editor):
+    # Runs while raw is still a plain BinaryField, so values are written as given
+    _rewrite_raw(apps, lambda raw: raw if bytes(raw).startswith((MAGIC, ZSTD_MAGIC)) else compress(raw))
+
+
+def decompress_raw(apps, schema_editor):
+    _rewrite_raw(apps, decompress)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_email_indexer', '0009_account_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(compress_raw, decompress_raw),
+        migrations.AlterField(
+            model_name='googlemailmessageraw',
+            name='raw',
+            field=google_email_indexer.models.CompressedBinaryField(),
+        ),
+    ]
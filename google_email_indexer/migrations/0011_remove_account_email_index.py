@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-16 01:15
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_email_indexer', '0010_compress_raw'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='googlemailmessage',
+            name='google_emai_account_938e9f_idx',
+        ),
+    ]
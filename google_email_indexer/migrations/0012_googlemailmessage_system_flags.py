@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-16 01:24
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+# Frozen copy of models.SYSTEM_LABEL_FLAGS / system_flags_from_labels as of this migration
+SYSTEM_LABEL_FLAGS = {
+    'UNREAD': 1,
+    'STARRED': 2,
+    'IMPORTANT': 4,
+    'INBOX': 8,
+    'SENT': 16,
+    'TRASH': 32,
+    'SPAM': 64,
+    'DRAFT': 128,
+}
+
+
+def system_flags_from_labels(label_ids):
+    flags = 0
+    for label_id in label_ids or ():
+        flags |= SYSTEM_LABEL_FLAGS.get(label_id, 0)
+    return flags
+
+
+def fill_system_flags(apps, schema_editor):
+    GoogleMailMessage = apps.get_model('google_email_indexer', 'GoogleMailMessage')
+
+    # Few distinct label combinations exist, so update all messages sharing a value at once
+    pks_by_flags = defaultdict(list)
+    for pk, label_ids in GoogleMailMessage.objects.values_list('pk', 'label_ids').iterator(chunk_size=500):
+        flags = system_flags_from_labels(label_ids)
+        if flags:
+            pks_by_flags[flags].append(pk)
+    for flags, pks in pks_by_flags.items():
+        for start in range(0, len(pks), 500):
+            GoogleMailMessage.objects.filter(pk__in=pks[start:start + 500]).update(system_flags=flags)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_email_indexer', '0011_remove_account_email_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='googlemailmessage',
+            name='system_flags',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Bitmask of the system labels in label_ids, see SYSTEM_LABEL_FLAGS'),
+        ),
+        migrations.RunPython(fill_system_flags, migrations.RunPython.noop),
+    ]
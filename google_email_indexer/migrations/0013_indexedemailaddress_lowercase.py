@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 01:25
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_email_indexer', '0012_googlemailmessage_system_flags'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='indexedemailaddress',
+            constraint=models.CheckConstraint(condition=models.Q(('email', django.db.models.functions.text.Lower('email'))), name='indexed_email_lowercase'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-16 01:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_email_indexer', '0013_indexedemailaddress_lowercase'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='googlemailmessage',
+            name='google_emai_is_read_cdb03a_idx',
+        ),
+        migrations.AddIndex(
+            model_name='googlemailmessage',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['account_email', '-internal_date'], name='idx_acct_unread'),
+        ),
+        migrations.AddIndex(
+            model_name='googlemailmessage',
+            index=models.Index(condition=models.Q(('is_starred', True)), fields=['account_email', '-internal_date'], name='idx_acct_starred'),
+        ),
+    ]
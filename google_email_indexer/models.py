@@ -1,12 +1,23 @@
 import json
+import re
+import zlib
 from collections import namedtuple
+from functools import cached_property
+from email import message_from_bytes
+from email.parser import BytesHeaderParser
 from email.utils import formataddr, parseaddr, parsedate_to_datetime, getaddresses
-from mailbox import Message
-from rich.table import Table
 
-from django.db import models
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, models, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Cast, Coalesce, Lower
 from django.utils import timezone
 
+try:
+    import zstandard
+except ImportError:  # Optional, installed with the "fast" extra; only needed to read zstd values
+    zstandard = None
+
 def _decode_name(name):
     if name.startswith("=?") and name.endswith("?="):
         try:
@@ -20,11 +31,23 @@ def _decode_name(name):
 
     return name
 
+_ATOM = r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+"
+_DOT_ATOM = rf"{_ATOM}(?:\.{_ATOM})*"
+# The common "Name <user@host>" and "user@host" forms, for which parseaddr
+# returns the name and address unchanged
+_SIMPLE_ADDRESS = re.compile(
+    rf"(?:(?P<name>[A-Za-z0-9'_-]+(?: [A-Za-z0-9'_-]+)*) <(?P<angle>{_DOT_ATOM}@{_DOT_ATOM})>|(?P<bare>{_DOT_ATOM}@{_DOT_ATOM}))"
+)
+
+
 class EmailAddress(namedtuple("EmailAddress", "name email")):
     __slots__ = ()
 
     @classmethod
     def from_rfc_address(cls, rfc_address):
+        match = _SIMPLE_ADDRESS.fullmatch(rfc_address) if isinstance(rfc_address, str) else None
+        if match:
+            return cls(match["name"] or "", match["angle"] or match["bare"])
         name, email = parseaddr(rfc_address)
         name = _decode_name(name)
         return cls(name, email)
@@ -53,6 +76,17 @@ class SyncState(models.Model):
 
 
 
+class IndexedEmailAddressQuerySet(models.QuerySet):
+    def refresh_message_counts(self):
+        """Recount message_count of these addresses in a single UPDATE, without loading any rows"""
+        return self.update(
+            message_count=Coalesce(Subquery(
+                MessageEmailAddress.objects.filter(email_address=OuterRef('pk'))
+                .values('email_address').annotate(count=Count('pk')).values('count')
+            ), 0)
+        )
+
+
 class IndexedEmailAddress(models.Model):
     """Stores unique email addresses for indexing and filtering"""
     email = models.EmailField(unique=True, help_text="Normalized (lowercase) email address")
@@ -60,6 +94,8 @@ class IndexedEmailAddress(models.Model):
     first_seen = models.DateTimeField(null=True, blank=True, help_text="When this email address first appeared in a message")
     last_seen = models.DateTimeField(null=True, blank=True, help_text="When this email address last appeared in a message")
     message_count = models.PositiveIntegerField(default=0, help_text="Number of messages this email appears in")
+
+    objects = IndexedEmailAddressQuerySet.as_manager()
     
     class Meta:
         ordering = ['email']
@@ -67,14 +103,18 @@ class IndexedEmailAddress(models.Model):
             models.Index(fields=['email']),
             models.Index(fields=['message_count']),
         ]
+        constraints = [
+            # Callers store emails lowercased (bulk_create bypasses save() and clean()),
+            # so lookups can be case-insensitive without LOWER() in every query
+            models.CheckConstraint(condition=models.Q(email=Lower('email')), name='indexed_email_lowercase'),
+        ]
     
     def __str__(self):
         return self.email
     
-    def save(self, *args, **kwargs):
-        # Ensure email is stored in lowercase for case-insensitive lookups
+    def clean(self):
+        # Forms (e.g. the admin) may be given mixed-case addresses
         self.email = self.email.lower()
-        super().save(*args, **kwargs)
 
 
 class MessageEmailAddress(models.Model):
@@ -103,6 +143,109 @@ class MessageEmailAddress(models.Model):
         return f"{self.email_address.email} ({self.field}) in {self.message.message_id}"
 
 
+def _split_header_block(raw):
+    """Split a raw RFC 822 message into its header block and body (None without an empty line)"""
+    # The headers end at the first empty line, whichever line ending is used
+    for separator in (b"\r\n", b"\n"):
+        if raw.startswith(separator):
+            return b"", raw[len(separator):]
+    # Whether the header lines end in CRLF or LF, the empty line follows a LF
+    ends = [
+        (end, len(separator)) for separator in (b"\n\r\n", b"\n\n")
+        if (end := raw.find(separator)) != -1
+    ]
+    if not ends:
+        return raw, None
+    end, length = min(ends)
+    return raw[:end + 1], raw[end + length:]
+
+
+# Bits of GoogleMailMessage.system_flags for the common Gmail system labels
+SYSTEM_LABEL_FLAGS = {
+    'UNREAD': 1,
+    'STARRED': 2,
+    'IMPORTANT': 4,
+    'INBOX': 8,
+    'SENT': 16,
+    'TRASH': 32,
+    'SPAM': 64,
+    'DRAFT': 128,
+}
+
+
+def system_flags_from_labels(label_ids):
+    """Bitmask of the system labels (SYSTEM_LABEL_FLAGS) among label_ids"""
+    flags = 0
+    for label_id in label_ids or ():
+        flags |= SYSTEM_LABEL_FLAGS.get(label_id, 0)
+    return flags
+
+
+def message_id_from_raw(raw):
+    """Message-ID header of a raw RFC 822 message, parsing only its header block"""
+    headers, _ = _split_header_block(raw)
+    return BytesHeaderParser().parsebytes(headers).get("Message-ID")
+
+
+def _parse_message(raw):
+    """
+    Parse a raw RFC 822 message like email.message_from_bytes.
+
+    The feed parser reads the body line by line even when it has no MIME
+    structure, so a single-part message gets only its headers parsed and
+    the body set as its payload in one go.
+    """
+    headers, body = _split_header_block(raw)
+    # The feed parser also ends lines at a bare CR, which the split does not
+    if body is not None and headers.count(b"\r") == headers.count(b"\r\n"):
+        message = BytesHeaderParser().parsebytes(headers)
+        # A payload here means a non-header line before the empty line
+        if not message.get_payload() and message.get_content_maintype() not in ('multipart', 'message'):
+            message.set_payload(body.decode('ascii', 'surrogateescape'))
+            return message
+    return message_from_bytes(raw)
+
+
+def _extract_addresses(mbox):
+    """(field, addresses) pairs of the address headers indexed for a message"""
+    from_header = mbox.get("From")
+    from_header_value = EmailAddress.from_header_value
+    return (
+        ('from', [EmailAddress.from_rfc_address(from_header)] if from_header else []),
+        ('to', from_header_value(mbox.get_all("To", []))),
+        ('cc', from_header_value(mbox.get_all("Cc", []))),
+        # Add more fields as needed (bcc, reply_to, etc.)
+    )
+
+
+def _part_size(part, exact=False):
+    """
+    Decoded size in bytes of a MIME part, estimated without decoding unless exact.
+
+    The estimate is exact for base64 and unencoded parts; quoted-printable
+    parts are counted at their encoded size, which overstates escaped bytes
+    and soft line breaks.
+    """
+    payload = part.get_payload()
+    if not payload or not isinstance(payload, str):
+        return 0
+    if exact:
+        return len(part.get_payload(decode=True))
+
+    content_length = part.get('Content-Length', '').strip()
+    if content_length.isdigit():
+        return int(content_length)
+
+    encoding = part.get('Content-Transfer-Encoding', '').strip().lower()
+    if encoding == 'base64':
+        # Every 4 base64 characters (ignoring line breaks and other whitespace)
+        # encode 3 bytes, less one byte per trailing '=' of padding
+        encoded_length = len(payload) - sum(payload.count(c) for c in ' \t\r\n')
+        padding = payload[-100:].rstrip()[-2:].count('=')
+        return encoded_length * 3 // 4 - padding
+    return len(payload)
+
+
 def _as_text(value):
     if isinstance(value, list):
         return [_as_text(v) for v in value]
@@ -110,6 +253,30 @@ def _as_text(value):
         return str(value)
 
 
+class GoogleMailMessageQuerySet(models.QuerySet):
+    def with_any_label(self, label_ids):
+        """
+        Messages carrying at least one of the given Gmail label IDs.
+
+        On backends with JSON containment (label_ids @> '["INBOX"]' on PostgreSQL,
+        served by a GIN index) this is done with the contains lookup, elsewhere it
+        falls back to matching the quoted label in the serialized list. That match
+        is case-sensitive, as label IDs are, and the quotes keep Label_1 from
+        matching Label_10.
+        """
+        if connections[self.db].features.supports_json_field_contains:
+            condition = models.Q()
+            for label_id in label_ids:
+                condition |= models.Q(label_ids__contains=[label_id])
+            return self.filter(condition)
+
+        # LIKE (contains) is case-insensitive on SQLite, regular expressions are not
+        pattern = "|".join(re.escape(json.dumps(label_id)) for label_id in label_ids)
+        if not pattern:
+            return self
+        return self.alias(label_ids_text=Cast('label_ids', models.TextField())).filter(label_ids_text__regex=pattern)
+
+
 # Create your models here.
 class GoogleMailMessage(models.Model):
     message_id = models.CharField(max_length=255)
@@ -119,7 +286,6 @@ class GoogleMailMessage(models.Model):
     snippet = models.TextField()
     label_ids = models.JSONField()
     original_message_id = models.CharField(max_length=255, null=True, blank=True)
-    raw = models.BinaryField()
     internal_date = models.PositiveBigIntegerField()
     
     # Additional useful fields for email management
@@ -127,6 +293,9 @@ class GoogleMailMessage(models.Model):
     is_read = models.BooleanField(default=False)
     is_starred = models.BooleanField(default=False)
     is_important = models.BooleanField(default=False)
+    system_flags = models.PositiveSmallIntegerField(
+        default=0, help_text="Bitmask of the system labels in label_ids, see SYSTEM_LABEL_FLAGS"
+    )
     
     # Many-to-many relationship with email addresses
     email_addresses = models.ManyToManyField(
@@ -140,45 +309,78 @@ class GoogleMailMessage(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = GoogleMailMessageQuerySet.as_manager()
+
     class Meta:
         ordering = ['-internal_date']
         indexes = [
-            models.Index(fields=['account_email']),
             models.Index(fields=['thread_id']),
             models.Index(fields=['internal_date']),
-            models.Index(fields=['is_read']),
-            models.Index(fields=['account_email', 'internal_date']),
+            # Newest messages of an account, e.g. the history ID fallback
+            models.Index(fields=['account_email', '-internal_date'], name='idx_acct_date'),
+            # Partial indexes holding only the few unread / starred messages
+            # (backends without partial indexes skip them)
+            models.Index(
+                fields=['account_email', '-internal_date'], name='idx_acct_unread',
+                condition=models.Q(is_read=False),
+            ),
+            models.Index(
+                fields=['account_email', '-internal_date'], name='idx_acct_starred',
+                condition=models.Q(is_starred=True),
+            ),
             models.Index(fields=['original_message_id']),
         ]
         constraints = [
-            models.UniqueConstraint(fields=['message_id', 'account_email'], name='unique_message_per_account')
+            # Account first, so the constraint's index also serves every
+            # account_email + message_id lookup of the sync
+            models.UniqueConstraint(fields=['account_email', 'message_id'], name='unique_message_per_account')
         ]
 
     def __str__(self):
         return f"{self.message_id} - {self.header_subject or '(No Subject)'}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Content assigned through the raw setter is not saved yet; write it
+        # along with the message, now that the message has a pk
+        raw_body = self._state.fields_cache.get("raw_body")
+        if raw_body is not None and raw_body._state.adding:
+            raw_body.message = self
+            raw_body.save(using=self._state.db)
+
     @property
+    def raw(self):
+        """Raw RFC 822 message, stored separately in GoogleMailMessageRaw"""
+        try:
+            return self.raw_body.raw
+        except GoogleMailMessageRaw.DoesNotExist:
+            return None
+
+    @raw.setter
+    def raw(self, value):
+        # Saved by save(), or by the bulk writes of the sync
+        self.raw_body = GoogleMailMessageRaw(message=self, raw=value)
+        # Drop anything parsed from the previous content
+        self.__dict__.pop("mbox", None)
+        self.__dict__.pop("_parts", None)
+
+    @cached_property
     def mbox(self):
-        if not getattr(self, "_mbox", None):
-            # Convert memoryview to bytes if necessary
-            raw_data = bytes(self.raw) if isinstance(self.raw, memoryview) else self.raw
-            self._mbox = Message(raw_data)
-        return self._mbox
+        raw = self.raw
+        # Convert memoryview to bytes if necessary
+        raw_data = bytes(raw) if isinstance(raw, memoryview) else raw
+        # Parsed directly rather than via mailbox.Message, which parses the same
+        # way and then copies the whole result into a second message object
+        return _parse_message(raw_data or b"")
+
+    @cached_property
+    def _parts(self):
+        """All MIME parts of the message, walked once and shared by find_parts and summarise_attachments"""
+        return list(self.mbox.walk())
 
     @property
     def json(self):
-        return {
-            "from": _as_text(self.header_from),
-            "to": _as_text(self.header_to),
-            "cc": _as_text(self.header_cc),
-            "subject": self.header_subject,
-            "text": "\n".join(
-                [
-                    p.get_payload(decode=True).decode(p.get_content_charset())
-                    for p in self.find_parts("text/plain")
-                ]
-            ),
-        }
+        return self.to_dict()
 
     def to_dict(self, include_attachments=False, max_message_length=None):
         data = {
@@ -188,7 +390,8 @@ class GoogleMailMessage(models.Model):
             "subject": self.header_subject,
             "text": "\n".join(
                 [
-                    p.get_payload(decode=True).decode(p.get_content_charset())
+                    # Parts without a charset (e.g. rebuilt from metadata headers) are read as UTF-8
+                    p.get_payload(decode=True).decode(p.get_content_charset() or "utf-8", errors="replace")
                     for p in self.find_parts("text/plain")
                 ]
             ),
@@ -204,7 +407,7 @@ class GoogleMailMessage(models.Model):
 
     def find_parts(self, content_type):
         return [
-            part for part in self.mbox.walk() if content_type in part.get_content_type()
+            part for part in self._parts if content_type in part.get_content_type()
         ]
 
     @property
@@ -224,29 +427,36 @@ class GoogleMailMessage(models.Model):
         return self.mbox.get("Subject")
 
     def update_flags_from_labels(self):
-        """Update boolean flags based on Gmail label_ids"""
-        if not self.label_ids:
-            return
-            
+        """Update boolean flags based on Gmail label_ids (in memory only, nothing is saved)"""
+        # A message without any labels is read, unstarred and unimportant; its
+        # flags must still be reset when its last label is removed
+        self.system_flags = system_flags_from_labels(self.label_ids)
+        
         # Common Gmail system labels
-        self.is_read = 'UNREAD' not in self.label_ids
-        self.is_starred = 'STARRED' in self.label_ids
-        self.is_important = 'IMPORTANT' in self.label_ids
+        self.is_read = not self.system_flags & SYSTEM_LABEL_FLAGS['UNREAD']
+        self.is_starred = bool(self.system_flags & SYSTEM_LABEL_FLAGS['STARRED'])
+        self.is_important = bool(self.system_flags & SYSTEM_LABEL_FLAGS['IMPORTANT'])
         
-    def summarise_attachments(self):
-        """Generator that yields attachment summaries"""
-        for part in self.mbox.walk():
+    def summarise_attachments(self, exact=False):
+        """
+        Generator that yields attachment summaries
+
+        Sizes are estimated from the encoded payload unless exact is set, which
+        decodes every attachment to count its bytes.
+        """
+        for part in self._parts:
             if part.get_content_disposition() == 'attachment':
                 filename = part.get_filename()
                 if filename:
                     yield {
                         'filename': filename,
                         'content_type': part.get_content_type(),
-                        'size': len(part.get_payload(decode=True)) if part.get_payload() else 0
+                        'size': _part_size(part, exact),
                     }
 
+    @transaction.atomic
     def index_email_addresses(self):
-        """Extract and index all email addresses from this message"""
+        """Extract and index all email addresses from this message, in one transaction"""
         from datetime import datetime
         from email.utils import parsedate_to_datetime
         
@@ -270,54 +480,119 @@ class GoogleMailMessage(models.Model):
             )
         
         # Clear existing email address relationships for this message
-        self.messageemailaddress_set.all().delete()
+        MessageEmailAddress.objects.filter(message=self).delete()
         
-        email_field_mapping = [
-            ('from', [self.header_from] if self.header_from else []),
-            ('to', self.header_to or []),
-            ('cc', self.header_cc or []),
-            # Add more fields as needed (bcc, reply_to, etc.)
-        ]
-        
-        for field_name, email_list in email_field_mapping:
+        # The first non-empty display name seen for each address wins
+        names = {}
+        relationships = {}
+        for field_name, email_list in _extract_addresses(self.mbox):
             for email_addr in email_list:
                 if email_addr and email_addr.email:
-                    # Get or create the indexed email address
-                    indexed_email, created = IndexedEmailAddress.objects.get_or_create(
-                        email=email_addr.email.lower(),
-                        defaults={
-                            'display_name': email_addr.name or '',
-                            'message_count': 0,
-                            'first_seen': message_date,
-                            'last_seen': message_date
-                        }
-                    )
-                    
-                    # Update the display name if this one is better (has a name when the stored one doesn't)
-                    if email_addr.name and not indexed_email.display_name:
-                        indexed_email.display_name = email_addr.name
-                    
-                    # For existing records, update first_seen if it's not set or if this message is older
-                    if not created:
-                        if indexed_email.first_seen is None or message_date < indexed_email.first_seen:
-                            indexed_email.first_seen = message_date
-                        if indexed_email.last_seen is None or message_date > indexed_email.last_seen:
-                            indexed_email.last_seen = message_date
-                    
-                    indexed_email.save()
-                    
-                    # Create the relationship
-                    MessageEmailAddress.objects.get_or_create(
-                        message=self,
-                        email_address=indexed_email,
-                        field=field_name,
-                        defaults={'display_name': email_addr.name or ''}
-                    )
-        
-        # Update message counts for all related email addresses
-        for email_addr in self.email_addresses.all():
-            email_addr.message_count = email_addr.messages.count()
-            email_addr.save()
+                    email = email_addr.email.lower()
+                    if not names.get(email):
+                        names[email] = email_addr.name or ''
+                    relationships.setdefault((email, field_name), email_addr.name or '')
+        if not names:
+            return
+
+        # Create the addresses not indexed yet, then fetch them all in one query
+        existing = IndexedEmailAddress.objects.in_bulk(names, field_name='email')
+        IndexedEmailAddress.objects.bulk_create([
+            IndexedEmailAddress(email=email, display_name=name, first_seen=message_date, last_seen=message_date)
+            for email, name in names.items() if email not in existing
+        ], ignore_conflicts=True)
+        indexed = IndexedEmailAddress.objects.in_bulk(names, field_name='email')
+
+        changed = []
+        for email, indexed_email in indexed.items():
+            if email not in existing:
+                continue
+            updated = False
+            # Update the display name if this one is better (has a name when the stored one doesn't)
+            if names[email] and not indexed_email.display_name:
+                indexed_email.display_name = names[email]
+                updated = True
+            if indexed_email.first_seen is None or message_date < indexed_email.first_seen:
+                indexed_email.first_seen = message_date
+                updated = True
+            if indexed_email.last_seen is None or message_date > indexed_email.last_seen:
+                indexed_email.last_seen = message_date
+                updated = True
+            if updated:
+                changed.append(indexed_email)
+        IndexedEmailAddress.objects.bulk_update(changed, ['display_name', 'first_seen', 'last_seen'], batch_size=1000)
+
+        MessageEmailAddress.objects.bulk_create([
+            MessageEmailAddress(message=self, email_address=indexed[email], field=field_name, display_name=name)
+            for (email, field_name), name in relationships.items()
+        ], ignore_conflicts=True)
+
+        # Update message counts for all related email addresses in a single UPDATE
+        IndexedEmailAddress.objects.filter(pk__in=[e.pk for e in indexed.values()]).refresh_message_counts()
+
+class CompressedBinaryField(models.BinaryField):
+    """
+    BinaryField stored compressed in the database.
+
+    Values are compressed with zlib, so that the stored format does not depend
+    on the packages installed; values under MIN_COMPRESS_SIZE are stored as
+    they are. Compressed values start with the magic of their format, so
+    values written before the field was compressed can always be read back,
+    and zstd values written by earlier versions can be read when zstandard
+    is installed.
+    """
+    MAGIC = b"\x00zlib:"
+    ZSTD_MAGIC = b"\x00zstd:"
+    MIN_COMPRESS_SIZE = 4096
+
+    @classmethod
+    def compress(cls, value):
+        value = bytes(value)
+        if len(value) < cls.MIN_COMPRESS_SIZE:
+            return value
+        return cls.MAGIC + zlib.compress(value)
+
+    @classmethod
+    def decompress(cls, value):
+        value = bytes(value)
+        if value.startswith(cls.ZSTD_MAGIC):
+            if zstandard is None:
+                raise ImproperlyConfigured("zstandard is needed to read zstd-compressed values")
+            return zstandard.ZstdDecompressor().decompress(value[len(cls.ZSTD_MAGIC):])
+        if value.startswith(cls.MAGIC):
+            return zlib.decompress(value[len(cls.MAGIC):])
+        return value
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None:
+            return value
+        return self.compress(value)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return self.decompress(value)
+
+
+class GoogleMailMessageRaw(models.Model):
+    """
+    Raw RFC 822 content of a GoogleMailMessage.
+
+    Kept out of the message table so that queries on message metadata (sync,
+    labels, listing) don't read the potentially large message bodies.
+    """
+    message = models.OneToOneField(
+        GoogleMailMessage,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='raw_body',
+    )
+    # RFC 822 text compresses well, typically 3-5x
+    raw = CompressedBinaryField()
+
+    def __str__(self):
+        return f"Raw content of {self.message.message_id}"
 
 
 class MesssageSource(models.Model):
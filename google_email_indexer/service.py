@@ -1,11 +1,110 @@
 import os
 import json
+import time
+import hashlib
+import logging
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
+import google_auth_httplib2
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google.oauth2 import service_account
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.http import build_http
+from googleapiclient.model import JsonModel
+
+try:
+    import orjson
+except ImportError:  # Optional, installed with the "fast" extra
+    orjson = None
+
+# Maximum number of calls Gmail accepts in a single HTTP batch request
+BATCH_REQUEST_LIMIT = 100
+
+# How often calls rejected with 429 Too Many Requests are retried
+RATE_LIMIT_RETRIES = 5
+
+# Gmail quota units charged for a single messages.get call
+MESSAGE_GET_QUOTA_UNITS = 5
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=32)
+def _load_service_account_credentials(credentials_file, scopes, user_email):
+    """
+    Service account credentials, loaded once per process for each file, scopes and user.
+
+    Sharing them lets every GoogleEmailService (one per sync task) reuse the
+    parsed private key and the access token until it expires.
+    """
+    creds = service_account.Credentials.from_service_account_file(credentials_file, scopes=list(scopes))
+    # If user_email is specified, delegate domain-wide authority
+    if user_email:
+        creds = creds.with_subject(user_email)
+    return creds
+
+
+class _QuotaBucket:
+    """
+    Token bucket spending an account's Gmail quota units at a steady rate.
+
+    acquire() reserves the units right away and sleeps until the bucket has
+    refilled enough to pay for them, so concurrent callers queue up behind
+    each other and together never exceed rate units per second.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, units):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate) - units
+            self.updated = now
+            wait = -self.tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+_quota_buckets = {}
+_quota_buckets_lock = threading.Lock()
+
+
+def _quota_bucket(account_key):
+    """The quota bucket of an account, shared by every service and thread of this process."""
+    rate = getattr(settings, 'GMAIL_QUOTA_UNITS_PER_SECOND', 250)
+    with _quota_buckets_lock:
+        bucket = _quota_buckets.get(account_key)
+        if bucket is None or bucket.rate != rate:
+            bucket = _quota_buckets[account_key] = _QuotaBucket(rate)
+        return bucket
+
+
+def clear_service_cache():
+    """Forget cached credentials, e.g. after a credentials file was replaced."""
+    _load_service_account_credentials.cache_clear()
+
+
+class OrjsonModel(JsonModel):
+    """JsonModel that parses API responses with orjson instead of the json module."""
+
+    def deserialize(self, content):
+        try:
+            body = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            # Let JsonModel handle non-JSON bodies the way it always does
+            return super().deserialize(content)
+        if self._data_wrapper and "data" in body:
+            body = body["data"]
+        return body
+
 
 class GoogleEmailService:
     """Basic Gmail API service for accessing email data."""
@@ -26,7 +125,16 @@ class GoogleEmailService:
         self.scopes = getattr(settings, 'GOOGLE_API_SCOPES', [
             'https://www.googleapis.com/auth/gmail.readonly'
         ])
+        # Remembers which account each set of credentials resolves to
+        self.account_cache_file = getattr(
+            settings, 'GOOGLE_ACCOUNT_CACHE_FILE',
+            os.path.splitext(self.token_file)[0] + '.accounts.json'
+        )
         self._service = None  # Lazy initialization
+        self._service_thread = None
+        self._credentials = None
+        # httplib2 is not thread-safe, so concurrent batches each use their own client
+        self._local = threading.local()
     
     def _is_service_account_credentials(self):
         """Check if the credentials file is for a service account."""
@@ -37,11 +145,62 @@ class GoogleEmailService:
         except (FileNotFoundError, json.JSONDecodeError, KeyError):
             return False
     
+    def _account_cache_key(self):
+        """
+        Stable key for the account these credentials give access to.
+
+        Service accounts are keyed by credentials file and delegated user, OAuth2
+        credentials by their refresh token. Only a hash of the identity is used.
+        Returns None if the account cannot be identified without the API.
+        """
+        if self._is_service_account_credentials():
+            identity = f"service_account:{os.path.abspath(self.credentials_file)}:{self.user_email or ''}"
+        else:
+            try:
+                with open(self.token_file, 'r') as f:
+                    token_data = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                return None
+            if not token_data.get('refresh_token'):
+                return None
+            identity = f"oauth:{token_data.get('client_id', '')}:{token_data['refresh_token']}"
+        return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+    
+    def _read_account_cache(self):
+        try:
+            with open(self.account_cache_file, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+    
+    def get_cached_account_email(self):
+        """Return the account email previously resolved for these credentials, if any."""
+        cache_key = self._account_cache_key()
+        if cache_key is None:
+            return None
+        return self._read_account_cache().get(cache_key)
+    
+    def cache_account_email(self, account_email):
+        """Remember the account email these credentials resolve to, for later runs."""
+        cache_key = self._account_cache_key()
+        if cache_key is None or not account_email:
+            return
+        cache = self._read_account_cache()
+        cache[cache_key] = account_email
+        try:
+            tmp_file = f"{self.account_cache_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(cache, f)
+            os.replace(tmp_file, self.account_cache_file)
+        except OSError as e:
+            logger.warning("Could not write account cache %s: %s", self.account_cache_file, e)
+    
     @property
     def service(self):
         """Lazy initialization of the Gmail API service."""
         if self._service is None:
             self._service = self._build_service()
+            self._service_thread = threading.get_ident()
         return self._service
     
     def _build_service(self):
@@ -53,16 +212,11 @@ class GoogleEmailService:
     
     def _build_service_account_service(self):
         """Build Gmail API service using service account credentials."""
-        # Load service account credentials
-        creds = service_account.Credentials.from_service_account_file(
-            self.credentials_file, scopes=self.scopes
+        creds = _load_service_account_credentials(
+            os.path.abspath(self.credentials_file), tuple(self.scopes), self.user_email
         )
-        
-        # If user_email is specified, delegate domain-wide authority
-        if self.user_email:
-            creds = creds.with_subject(self.user_email)
-        
-        return build('gmail', 'v1', credentials=creds)
+        self._credentials = creds
+        return build('gmail', 'v1', credentials=creds, model=OrjsonModel() if orjson else None)
     
     def _build_oauth2_service(self):
         """Build Gmail API service using OAuth2 credentials (original implementation)."""
@@ -85,19 +239,32 @@ class GoogleEmailService:
             with open(self.token_file, 'w') as token:
                 token.write(creds.to_json())
         
-        return build('gmail', 'v1', credentials=creds)
+        self._credentials = creds
+        return build('gmail', 'v1', credentials=creds, model=OrjsonModel() if orjson else None)
     
     def list_messages(self, max_results=100, query=None, label_ids=None):
         """List messages in the user's mailbox with pagination support."""
         all_messages = []
-        next_page_token = None
-        
+        for page in self.iter_message_ids(max_results=max_results, query=query, label_ids=label_ids):
+            all_messages.extend(page)
+        return all_messages
+    
+    def iter_message_ids(self, max_results=100, query=None, label_ids=None, page_size=500):
+        """
+        Yield the user's messages one page at a time.
+
+        Each page is the list of message stubs ({'id', 'threadId'}) returned by one
+        messages.list call, so callers can start working on the first page while
+        later ones are still being listed.
+        """
         # Gmail API has a max of 500 per request, so we need pagination for larger requests
-        page_size = min(max_results, 500)
+        page_size = min(max_results, page_size, 500)
+        listed = 0
+        next_page_token = None
         
-        while len(all_messages) < max_results:
+        while listed < max_results:
             # Calculate how many messages to request in this page
-            remaining = max_results - len(all_messages)
+            remaining = max_results - listed
             current_page_size = min(remaining, page_size)
             
             kwargs = {
@@ -114,26 +281,175 @@ class GoogleEmailService:
                 
             result = self.service.users().messages().list(**kwargs).execute()
             
-            # Add messages from this page
-            page_messages = result.get('messages', [])
-            all_messages.extend(page_messages)
+            # Never yield more than max_results messages in total
+            page_messages = result.get('messages', [])[:remaining]
+            if not page_messages:
+                break
+            listed += len(page_messages)
+            yield page_messages
             
             # Check if there are more pages
             next_page_token = result.get('nextPageToken')
-            if not next_page_token or len(page_messages) == 0:
+            if not next_page_token:
                 break  # No more pages available
-        
-        return all_messages[:max_results]  # Ensure we don't exceed max_results
     
-    def get_message(self, message_id, format='full'):
+    def get_message(self, message_id, format='full', metadata_headers=None):
         """Get a specific message by ID."""
         result = self.service.users().messages().get(
-            userId='me', 
-            id=message_id, 
-            format=format
+            **self._message_get_kwargs(message_id, format, metadata_headers)
         ).execute()
         return result
     
+    @staticmethod
+    def _message_get_kwargs(message_id, format, metadata_headers=None):
+        """Arguments for messages.get; metadata_headers limits the headers of a format='metadata' response."""
+        kwargs = {'userId': 'me', 'id': message_id, 'format': format}
+        if metadata_headers:
+            kwargs['metadataHeaders'] = metadata_headers
+        return kwargs
+    
+    def batch_get_messages(self, message_ids, format='full', metadata_headers=None):
+        """
+        Get several messages using Gmail HTTP batch requests.
+
+        Messages are requested in batches of up to BATCH_REQUEST_LIMIT per HTTP
+        round-trip, with up to GMAIL_SYNC_CONCURRENCY batches in flight at once,
+        and no faster than the account's GMAIL_QUOTA_UNITS_PER_SECOND allow.
+        Returns a tuple of (messages, errors) where messages is a list of message
+        resources in the order of message_ids (failed ids are left out) and errors
+        maps each failed message id to its exception.
+        """
+        messages = {}
+        errors = {}
+        
+        concurrency = getattr(settings, 'GMAIL_SYNC_CONCURRENCY', 8)
+        if not getattr(settings, 'GMAIL_USE_BATCH_REQUESTS', True):
+            self._get_messages_concurrently(message_ids, format, metadata_headers, messages, errors, concurrency)
+            return [messages[message_id] for message_id in message_ids if message_id in messages], errors
+        
+        chunks = [
+            message_ids[start:start + BATCH_REQUEST_LIMIT]
+            for start in range(0, len(message_ids), BATCH_REQUEST_LIMIT)
+        ]
+        if len(chunks) <= 1 or concurrency <= 1:
+            for chunk in chunks:
+                self._execute_message_batch(chunk, format, metadata_headers, messages, errors)
+        else:
+            # Build the service up front so worker threads share one set of credentials
+            self.service
+            with ThreadPoolExecutor(max_workers=min(concurrency, len(chunks))) as executor:
+                futures = [
+                    executor.submit(self._execute_message_batch, chunk, format, metadata_headers, messages, errors)
+                    for chunk in chunks
+                ]
+                for future in futures:
+                    future.result()
+        
+        return [messages[message_id] for message_id in message_ids if message_id in messages], errors
+    
+    def _get_messages_concurrently(self, message_ids, format, metadata_headers, messages, errors, concurrency):
+        """
+        Fetch messages with one messages.get call each, up to concurrency at a time.
+
+        Used instead of HTTP batch requests when GMAIL_USE_BATCH_REQUESTS is off,
+        e.g. behind proxies that reject multipart batch bodies. Results are added
+        to the messages and errors dicts; 429s are retried with backoff by the
+        client library.
+        """
+        def fetch(message_id):
+            self._acquire_quota(1)
+            return self.service.users().messages().get(
+                **self._message_get_kwargs(message_id, format, metadata_headers)
+            ).execute(http=self._thread_http(), num_retries=RATE_LIMIT_RETRIES)
+        
+        # Build the service up front so worker threads share one set of credentials
+        self.service
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+            futures = {message_id: executor.submit(fetch, message_id) for message_id in message_ids}
+            for message_id, future in futures.items():
+                try:
+                    messages[message_id] = future.result()
+                except Exception as e:
+                    errors[message_id] = e
+    
+    def _execute_message_batch(self, message_ids, format, metadata_headers, messages, errors):
+        """
+        Fetch up to BATCH_REQUEST_LIMIT messages in one HTTP batch request.
+
+        Results are added to the messages and errors dicts. Calls rejected with
+        429 are retried after the Retry-After delay Gmail asks for.
+        """
+        http = self._thread_http()
+        pending = list(message_ids)
+        
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            self._acquire_quota(len(pending))
+            rate_limited = {}
+            
+            def callback(request_id, response, exception):
+                message_id = pending[int(request_id)]
+                if exception is None:
+                    messages[message_id] = response
+                elif getattr(exception, 'status_code', None) == 429:
+                    rate_limited[message_id] = exception
+                else:
+                    errors[message_id] = exception
+            
+            batch = self.service.new_batch_http_request(callback=callback)
+            for index, message_id in enumerate(pending):
+                batch.add(
+                    self.service.users().messages().get(
+                        **self._message_get_kwargs(message_id, format, metadata_headers)
+                    ),
+                    request_id=str(index)
+                )
+            batch.execute(http=http)
+            
+            if not rate_limited:
+                return
+            if attempt == RATE_LIMIT_RETRIES:
+                errors.update(rate_limited)
+                return
+            
+            delay = max(self._retry_after(exception, attempt) for exception in rate_limited.values())
+            logger.warning("Rate limited on %d messages, retrying in %ss", len(rate_limited), delay)
+            time.sleep(delay)
+            pending = list(rate_limited)
+    
+    def _acquire_quota(self, message_count):
+        """
+        Wait until the account's quota allows message_count more messages.get calls.
+
+        The rate is per process: with several workers syncing the same account,
+        divide GMAIL_QUOTA_UNITS_PER_SECOND between them.
+        """
+        account_key = (os.path.abspath(self.credentials_file), self.user_email or os.path.abspath(self.token_file))
+        _quota_bucket(account_key).acquire(message_count * MESSAGE_GET_QUOTA_UNITS)
+    
+    @staticmethod
+    def _retry_after(exception, attempt):
+        """Seconds to wait before retrying a rate limited call."""
+        try:
+            return float(exception.resp.get('retry-after'))
+        except (AttributeError, TypeError, ValueError):
+            return 2 ** attempt
+    
+    def _thread_http(self):
+        """
+        Authorized HTTP client owned by the current thread.
+
+        Returns None (use the service's own client) in the thread that built the
+        service, and a separate client in every other thread.
+        """
+        self.service
+        if threading.get_ident() == self._service_thread:
+            return None
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self._credentials, http=build_http())
+            self._local.http = http
+        return http
+    
     def list_history(self, start_history_id, max_results=100, history_types=None, label_id=None):
         """List history of changes since a specific history ID."""
         kwargs = {
@@ -168,11 +484,3 @@ class GoogleEmailService:
     def get_label(self, label_id):
         """Get details about a specific label."""
         return self.service.users().labels().get(userId='me', id=label_id).execute()
-    
-    def find_label_by_name(self, label_name):
-        """Find a label by its name (case-insensitive)."""
-        labels = self.list_labels()
-        for label in labels:
-            if label.get('name', '').lower() == label_name.lower():
-                return label
-        return None 
\ No newline at end of file
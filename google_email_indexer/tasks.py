@@ -1,5 +1,7 @@
 import logging
-from celery import shared_task
+from celery import chord, group, shared_task
+from celery.backends.base import DisabledBackend
+from googleapiclient.errors import HttpError
 
 from google_email_indexer.message_sync_service import MessageSyncService
 from google_email_indexer.models import MesssageSource
@@ -8,12 +10,26 @@ from google_email_indexer.email_indexing_service import EmailIndexingService
 
 logger = logging.getLogger(__name__)
 
-@shared_task
-def sync_configuration(source_ids: list[int] | None = None):
+@shared_task(bind=True)
+def sync_configuration(self, source_ids: list[int] | None = None):
     if source_ids is None:
         sources = MesssageSource.objects.all()
     else:
         sources = MesssageSource.objects.filter(id__in=source_ids)
+
+    # A chord needs a result backend to know when all syncs have finished
+    if not self.request.called_directly and not isinstance(self.app.backend, DisabledBackend):
+        # On a worker the mailboxes are synced in parallel, and the index is
+        # maintained once after all of them have finished
+        syncs = group(
+            sync_mailbox.s(
+                source.inbox, max_results=1000, force_full=False,
+                label_names=source.labels.split(',') if source.labels else None
+            )
+            for source in sources
+        )
+        chord(syncs)(maintain_email_index.si())
+        return
     
     for source in sources:
         logger.info(f"Syncing [{source.id}]: {source.inbox}")
@@ -32,7 +48,8 @@ def sync_configuration(source_ids: list[int] | None = None):
 
 
 
-@shared_task
+# Syncs are idempotent, so a sync lost with its worker or failed on an API error is simply run again
+@shared_task(acks_late=True, autoretry_for=(HttpError,), max_retries=3, retry_backoff=True)
 def sync_mailbox(account_email: str, max_results: int = 100, force_full: bool = False, label_names: list[str] | None = None):
     gmail_service = GoogleEmailService(user_email=account_email)
     sync_service = MessageSyncService(gmail_service=gmail_service, account_email_override=account_email)
@@ -78,4 +95,21 @@ def maintain_email_index(account_email: str | None = None):
         return {
             'success': False,
             'error': str(e)
-        }
\ No newline at end of file
+        }
+
+@shared_task
+def run_full_maintenance(account_email: str | None = None, batch_size: int = 1000):
+    """
+    Run all index maintenance operations in-process.
+
+    Lets a long-running worker (e.g. celery beat) schedule maintenance directly
+    instead of forking `manage.py maintain_email_index --full-maintenance`.
+
+    Args:
+        account_email: Optional account email to limit operations to
+        batch_size: Number of messages to process in each batch
+    """
+    return EmailIndexingService.run_maintenance(
+        account_email=account_email,
+        batch_size=batch_size
+    )
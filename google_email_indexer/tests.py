@@ -1,3 +1,447 @@
-from django.test import TestCase
+import base64
+from email import message_from_bytes
+from email.header import decode_header, make_header
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+
+try:
+    from google_email_indexer import tasks
+except ImportError:  # Celery is an optional dependency
+    tasks = None
+
+from google_email_indexer import message_sync_service, service
+from google_email_indexer.message_sync_service import MessageSyncService
+from google_email_indexer.models import (
+    CompressedBinaryField, EmailAddress, GoogleMailMessage, GoogleMailMessageRaw, IndexedEmailAddress,
+    MesssageSource, SyncState, _parse_message, _part_size, _split_header_block,
+)
+
+
+def make_raw(i):
+    return (f"From: Sender {i} <sender{i}@example.com>\r\nTo: a@example.com\r\n"
+            f"Subject: Message {i}\r\nMessage-ID: <m{i}@example.com>\r\n\r\nBody {i}\r\n").encode()
+
+
+def make_message(i, account_email='me@example.com'):
+    return GoogleMailMessage(
+        message_id=f'id{i}', account_email=account_email, history_id='1', thread_id=f't{i}',
+        snippet='', label_ids=['INBOX'], internal_date=1700000000000 + i, raw=make_raw(i),
+    )
+
+
+class FakeGmailService:
+    """In-memory stand-in for GoogleEmailService, serving the messages in `mailbox`"""
+
+    def __init__(self, mailbox, history=None, history_id='100'):
+        self.mailbox = mailbox
+        self.history = history or []
+        self.history_id = history_id
+        self.failing_ids = set()
+
+    def get_profile(self):
+        return {'emailAddress': 'me@example.com', 'historyId': self.history_id}
+
+    def iter_message_ids(self, max_results=100, query=None, label_ids=None, page_size=500):
+        ids = list(self.mailbox)[:max_results]
+        for start in range(0, len(ids), page_size):
+            yield [{'id': message_id} for message_id in ids[start:start + page_size]]
+
+    def batch_get_messages(self, message_ids, format='full', metadata_headers=None):
+        if self.failing_ids.intersection(message_ids):
+            raise OSError('connection reset')
+        messages, errors = [], {}
+        for message_id in message_ids:
+            if message_id not in self.mailbox:
+                errors[message_id] = KeyError(message_id)
+                continue
+            i, label_ids = self.mailbox[message_id]
+            message = {
+                'id': message_id, 'threadId': f't{i}', 'historyId': self.history_id,
+                'labelIds': label_ids, 'internalDate': str(1700000000000 + i), 'snippet': '',
+            }
+            if format == 'raw':
+                message['raw'] = base64.urlsafe_b64encode(make_raw(i)).decode()
+            messages.append(message)
+        return messages, errors
+
+    def list_history(self, start_history_id, max_results=100, history_types=None, label_id=None):
+        return {'history': self.history, 'historyId': self.history_id}
+
+    def list_labels(self):
+        return [{'id': 'INBOX', 'name': 'INBOX', 'type': 'system'}]
+
+
+class QuotaBucketTest(TestCase):
+    def test_spends_units_at_the_quota_rate(self):
+        clock = [100.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            clock[0] += seconds
+
+        with mock.patch.object(service.time, 'monotonic', lambda: clock[0]), \
+                mock.patch.object(service.time, 'sleep', sleep):
+            bucket = service._QuotaBucket(250)
+            # A full batch of 100 messages.get calls costs 500 units: a second's burst, then a second's wait
+            bucket.acquire(500)
+            bucket.acquire(500)
+            clock[0] += 10
+            bucket.acquire(250)
+
+        self.assertEqual(sleeps, [1.0, 2.0])
+
+
+class StoreMessagesCopyTest(TestCase):
+    """The COPY (django-bulk-load) branch of MessageSyncService._store_messages"""
+
+    def test_raw_rows_reference_their_saved_message(self):
+        written_message_ids = []
+
+        def bulk_upsert_models(objs, pk_field_names, insert_only_field_names):
+            if isinstance(objs[0], GoogleMailMessageRaw):
+                # What COPY would write, before bulk_create gets to fix up the foreign key
+                written_message_ids.extend(raw_body.message_id for raw_body in objs)
+            type(objs[0]).objects.bulk_create(objs, ignore_conflicts=True)
+
+        sync_service = MessageSyncService(gmail_service=mock.Mock(), account_email_override='me@example.com')
+        messages = [make_message(i) for i in range(3)]
+        with mock.patch.object(message_sync_service, 'bulk_upsert_models', bulk_upsert_models), \
+                mock.patch.object(message_sync_service, 'connections', {'default': mock.Mock(vendor='postgresql')}):
+            sync_service._store_messages(messages)
+
+        pks = [message.pk for message in messages]
+        self.assertNotIn(None, pks)
+        self.assertEqual(written_message_ids, pks)
+        self.assertEqual(
+            sorted(GoogleMailMessageRaw.objects.values_list('message_id', flat=True)), sorted(pks)
+        )
+
+
+class ParseMessageTest(TestCase):
+    """_parse_message gives the same result as email.message_from_bytes"""
+
+    MESSAGES = {
+        'crlf': b"From: a@example.com\r\nSubject: Hello\r\n\r\nBody\r\nmore\r\n",
+        'lf': b"From: a@example.com\nSubject: Hello\n\nBody\nmore\n",
+        'crlf headers, lf separator': b"From: a@example.com\r\nSubject: Hello\n\nBody\r\n",
+        'folded header': b"From: a@example.com\r\nSubject: A long\r\n\tfolded\r\n subject\r\n\r\nBody\r\n",
+        'no empty line': b"From: a@example.com\r\nSubject: Hello\r\n",
+        'body line before empty line': b"From: a@example.com\r\nnot a header\r\n\r\nBody\r\n",
+        'no headers': b"\r\nBody\r\n",
+        'bare cr': b"From: a@example.com\rSubject: Hello\r\n\r\nBody\r\n",
+        'encoded words': b"From: =?utf-8?q?H=C3=A9llo?= <a@example.com>\r\n"
+                         b"Subject: =?utf-8?b?aMOpbGxv?=\r\n\r\nBody\r\n",
+        '8-bit headers': "From: Héllo <a@example.com>\r\nSubject: héllo\r\n\r\ncafé\r\n".encode(),
+        'multipart': b"From: a@example.com\r\nContent-Type: multipart/alternative; boundary=b\r\n\r\n"
+                     b"--b\r\nContent-Type: text/plain\r\n\r\nText\r\n"
+                     b"--b\r\nContent-Type: text/html\r\n\r\n<p>Text</p>\r\n--b--\r\n",
+        'attached message': b"From: a@example.com\r\nContent-Type: message/rfc822\r\n\r\n"
+                            b"From: b@example.com\r\nSubject: Inner\r\n\r\nInner body\r\n",
+    }
+
+    def test_same_as_message_from_bytes(self):
+        for name, raw in self.MESSAGES.items():
+            with self.subTest(name):
+                message, expected = _parse_message(raw), message_from_bytes(raw)
+                self.assertEqual(message.items(), expected.items())
+                self.assertEqual(message.is_multipart(), expected.is_multipart())
+                self.assertEqual(
+                    [part.get_payload(decode=True) for part in message.walk()],
+                    [part.get_payload(decode=True) for part in expected.walk()],
+                )
+                self.assertEqual(message.as_bytes(), expected.as_bytes())
+
+    def test_split_header_block(self):
+        self.assertEqual(_split_header_block(b"A: 1\r\nB: 2\r\n\r\nBody"), (b"A: 1\r\nB: 2\r\n", b"Body"))
+        self.assertEqual(_split_header_block(b"A: 1\nB: 2\n\nBody"), (b"A: 1\nB: 2\n", b"Body"))
+        self.assertEqual(_split_header_block(b"A: 1\r\nB: 2\r\n"), (b"A: 1\r\nB: 2\r\n", None))
+        self.assertEqual(_split_header_block(b"\nBody"), (b"", b"Body"))
+
+
+class PartSizeTest(TestCase):
+    def test_base64_estimate_is_exact(self):
+        for size in (1000, 1001, 1002):
+            data = bytes(range(256)) * 4
+            encoded = base64.encodebytes(data[:size]).decode()
+            for payload in (encoded, encoded + '\n\n\n', encoded.replace('\n', '\r\n') + ' \r\n'):
+                with self.subTest(size=size, payload=payload[-6:]):
+                    part = message_from_bytes(
+                        b"Content-Type: application/octet-stream\r\nContent-Transfer-Encoding: base64\r\n\r\n"
+                    )
+                    part.set_payload(payload)
+                    self.assertEqual(_part_size(part), size)
+                    self.assertEqual(_part_size(part, exact=True), size)
+
+
+class WithAnyLabelTest(TestCase):
+    def test_matches_whole_label_ids_case_sensitively(self):
+        for i, label_ids in enumerate([['INBOX', 'Label_1'], ['Label_10'], ['label_1'], []]):
+            message = make_message(i)
+            message.label_ids = label_ids
+            message.save()
+
+        def matching(*label_ids):
+            return sorted(GoogleMailMessage.objects.with_any_label(label_ids).values_list('message_id', flat=True))
+
+        self.assertEqual(matching('Label_1'), ['id0'])
+        self.assertEqual(matching('Label_1', 'label_1'), ['id0', 'id2'])
+        self.assertEqual(matching('Label_10'), ['id1'])
+        self.assertEqual(matching('Label'), [])
+
+
+class RawContentTest(TestCase):
+    def test_save_stores_raw_content(self):
+        make_message(1).save()
+
+        message = GoogleMailMessage.objects.get(message_id='id1')
+        self.assertEqual(bytes(message.raw), make_raw(1))
+        self.assertEqual(str(message.raw_body), 'Raw content of id1')
+
+    def test_create_stores_raw_content(self):
+        GoogleMailMessage.objects.create(
+            message_id='id2', account_email='me@example.com', history_id='1', thread_id='t2',
+            label_ids=[], internal_date=1700000000000, raw=make_raw(2),
+        )
+
+        self.assertEqual(bytes(GoogleMailMessage.objects.get(message_id='id2').raw), make_raw(2))
+
+    def test_save_replaces_raw_content(self):
+        message = make_message(1)
+        message.save()
+        message = GoogleMailMessage.objects.get(message_id='id1')
+        message.raw = make_raw(3)
+        message.save()
+
+        self.assertEqual(bytes(GoogleMailMessage.objects.get(message_id='id1').raw), make_raw(3))
+        self.assertEqual(GoogleMailMessageRaw.objects.count(), 1)
+
+    def test_large_content_is_stored_as_zlib(self):
+        message = make_message(1)
+        message.raw = make_raw(1) + b"x" * CompressedBinaryField.MIN_COMPRESS_SIZE
+        message.save()
+
+        stored = GoogleMailMessageRaw.objects.filter(pk=message.pk).values_list('raw', flat=True).get()
+        self.assertEqual(stored, make_raw(1) + b"x" * CompressedBinaryField.MIN_COMPRESS_SIZE)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT raw FROM google_email_indexer_googlemailmessageraw")
+            self.assertTrue(bytes(cursor.fetchone()[0]).startswith(CompressedBinaryField.MAGIC))
+
+
+class MetadataPayloadTest(TestCase):
+    """Messages rebuilt from format=metadata headers (GMAIL_DOWNLOAD_BODY = False)"""
+
+    def test_non_ascii_headers(self):
+        payload = MessageSyncService._decode_payload({
+            'id': 'id1',
+            'payload': {'headers': [
+                {'name': 'From', 'value': 'Héllo Wörld <hello@example.com>'},
+                {'name': 'To', 'value': 'Zoë <zoe@example.com>, plain@example.com'},
+                {'name': 'Subject', 'value': 'héllo'},
+            ]},
+        })
+        message = make_message(1)
+        message.raw = payload['raw']
+
+        self.assertEqual(message.header_from, EmailAddress('Héllo Wörld', 'hello@example.com'))
+        self.assertEqual(message.header_to, [
+            EmailAddress('Zoë', 'zoe@example.com'), EmailAddress('', 'plain@example.com')
+        ])
+        self.assertEqual(str(make_header(decode_header(message.header_subject))), 'héllo')
+
+        message.save()
+        message.index_email_addresses()
+        self.assertEqual(IndexedEmailAddress.objects.get(email='hello@example.com').display_name, 'Héllo Wörld')
+
+    def test_to_dict_without_content_type(self):
+        payload = MessageSyncService._decode_payload({
+            'id': 'id1',
+            'payload': {'headers': [{'name': 'Subject', 'value': 'Hello'}]},
+        })
+        message = make_message(1)
+        message.raw = payload['raw']
+
+        self.assertEqual(message.to_dict()['subject'], 'Hello')
+
+    def test_to_dict_with_unknown_charset_bytes(self):
+        message = make_message(1)
+        message.raw = b"Subject: Hello\r\n\r\ncaf\xe9\r\n"
+
+        self.assertEqual(message.to_dict()['text'], 'caf\ufffd\r\n')
+
+
+class IndexEmailAddressesTest(TestCase):
+    def index(self, i, raw=None):
+        message = make_message(i)
+        if raw is not None:
+            message.raw = raw
+        message.save()
+        message.index_email_addresses()
+        return message
+
+    def test_creates_new_addresses(self):
+        message = self.index(1)
+
+        sender = IndexedEmailAddress.objects.get(email='sender1@example.com')
+        self.assertEqual(sender.display_name, 'Sender 1')
+        self.assertEqual(sender.first_seen, sender.last_seen)
+        self.assertEqual(sender.message_count, 1)
+        self.assertEqual(IndexedEmailAddress.objects.get(email='a@example.com').message_count, 1)
+        self.assertEqual(
+            sorted(message.messageemailaddress_set.values_list('email_address__email', 'field')),
+            [('a@example.com', 'to'), ('sender1@example.com', 'from')],
+        )
+
+    def test_updates_existing_addresses(self):
+        later = self.index(2)
+        existing = IndexedEmailAddress.objects.get(email='a@example.com')
+
+        # Older message, naming an address that was indexed without a name
+        self.index(1, b"From: sender1@example.com\r\nTo: Alice <A@example.com>\r\n\r\nBody\r\n")
+
+        address = IndexedEmailAddress.objects.get(email='a@example.com')
+        self.assertEqual(address.pk, existing.pk)
+        self.assertEqual(address.display_name, 'Alice')
+        self.assertLess(address.first_seen, existing.first_seen)
+        self.assertEqual(address.last_seen, existing.last_seen)
+        self.assertEqual(address.message_count, 2)
+        self.assertEqual(IndexedEmailAddress.objects.count(), 3)
+        self.assertEqual(later.messageemailaddress_set.count(), 2)
+
+    def test_reindexing_keeps_counts(self):
+        message = self.index(1)
+        self.index(2)
+
+        message.index_email_addresses()
+
+        self.assertEqual(
+            dict(IndexedEmailAddress.objects.values_list('email', 'message_count')),
+            {'a@example.com': 2, 'sender1@example.com': 1, 'sender2@example.com': 1},
+        )
+
+
+@skipUnless(tasks, "Celery is not installed")
+class SyncConfigurationTaskTest(TestCase):
+    def test_syncs_serially_without_result_backend(self):
+        MesssageSource.objects.create(inbox='one@example.com', labels='INBOX')
+        MesssageSource.objects.create(inbox='two@example.com')
+        with mock.patch.object(tasks, 'sync_mailbox', return_value={}) as sync_mailbox, \
+                mock.patch.object(tasks, 'maintain_email_index', return_value={}) as maintain_email_index:
+            # Runs the task as a worker would; the default app has no result backend
+            tasks.sync_configuration.apply().get()
+
+        self.assertEqual(
+            sorted(call.args[0] for call in sync_mailbox.call_args_list), ['one@example.com', 'two@example.com']
+        )
+        maintain_email_index.assert_called_once_with()
+
+
+@override_settings(GMAIL_SYNC_BATCH_SIZE=2)
+class FullSyncTest(TestCase):
+    def test_failed_batch_does_not_stop_the_sync(self):
+        gmail_service = FakeGmailService({f'id{i}': (i, ['INBOX']) for i in range(6)})
+        gmail_service.failing_ids = {'id2'}
+        sync_service = MessageSyncService(gmail_service=gmail_service, account_email_override='me@example.com')
+
+        stats = sync_service.sync_messages(max_results=10, force_full_sync=True)
+
+        self.assertEqual(stats['new_messages'], 4)
+        self.assertEqual(len(stats['errors']), 2)
+        self.assertEqual(
+            sorted(GoogleMailMessage.objects.values_list('message_id', flat=True)), ['id0', 'id1', 'id4', 'id5']
+        )
+
+    def test_failed_store_is_recorded_per_message(self):
+        gmail_service = FakeGmailService({f'id{i}': (i, ['INBOX']) for i in range(4)})
+        sync_service = MessageSyncService(gmail_service=gmail_service, account_email_override='me@example.com')
+        store_messages = sync_service._store_messages
+
+        def failing_store(messages):
+            if messages[0].message_id == 'id0':
+                raise RuntimeError('database unavailable')
+            store_messages(messages)
+
+        with mock.patch.object(sync_service, '_store_messages', failing_store):
+            stats = sync_service.sync_messages(max_results=10, force_full_sync=True)
+
+        self.assertEqual(stats['new_messages'], 2)
+        self.assertEqual(stats['errors'], [
+            'Failed to store message id0: database unavailable',
+            'Failed to store message id1: database unavailable',
+        ])
+
+
+class IncrementalSyncTest(TestCase):
+    def sync(self, gmail_service):
+        sync_service = MessageSyncService(gmail_service=gmail_service, account_email_override='me@example.com')
+        return sync_service.sync_messages()
+
+    def setUp(self):
+        SyncState.objects.create(account_email='me@example.com', last_history_id='50')
+        make_message(1).save()
+
+    def test_failed_download_keeps_deletions_and_history_id(self):
+        gmail_service = FakeGmailService({'id9': (9, ['INBOX'])}, history=[
+            {'messagesDeleted': [{'message': {'id': 'id1'}}]},
+            {'messagesAdded': [{'message': {'id': 'id9', 'labelIds': ['INBOX']}}]},
+        ])
+        gmail_service.failing_ids = {'id9'}
+
+        with mock.patch.object(MessageSyncService, '_full_sync') as full_sync:
+            stats = self.sync(gmail_service)
+
+        full_sync.assert_not_called()
+        self.assertEqual(stats['messages_deleted'], 1)
+        self.assertEqual(stats['errors'], ['Failed to add messages id9: connection reset'])
+        self.assertEqual(stats['history_id'], '50')
+        self.assertFalse(GoogleMailMessage.objects.exists())
+        self.assertEqual(SyncState.objects.get(account_email='me@example.com').last_history_id, '50')
+
+    def test_applied_changes_advance_history_id(self):
+        gmail_service = FakeGmailService({'id9': (9, ['INBOX'])}, history=[
+            {'messagesAdded': [{'message': {'id': 'id9', 'labelIds': ['INBOX']}}]},
+        ])
+
+        stats = self.sync(gmail_service)
+
+        self.assertEqual(stats['messages_added'], 1)
+        self.assertEqual(SyncState.objects.get(account_email='me@example.com').last_history_id, '100')
+
+    def test_added_then_deleted_message_is_not_downloaded(self):
+        gmail_service = FakeGmailService({}, history=[
+            {'messagesAdded': [{'message': {'id': 'id1', 'labelIds': ['INBOX']}}]},
+            {'labelsAdded': [{'message': {'id': 'id1'}, 'labelIds': ['STARRED']}]},
+            {'messagesDeleted': [{'message': {'id': 'id1'}}]},
+        ])
+
+        with mock.patch.object(gmail_service, 'batch_get_messages', wraps=gmail_service.batch_get_messages) as get:
+            stats = self.sync(gmail_service)
+
+        get.assert_not_called()
+        self.assertEqual(stats['messages_deleted'], 1)
+        self.assertEqual(stats['errors'], [])
+        self.assertFalse(GoogleMailMessage.objects.exists())
+
+    def test_label_changes(self):
+        gmail_service = FakeGmailService({'id1': (1, ['INBOX', 'STARRED']), 'id9': (9, ['INBOX'])}, history=[
+            {'labelsAdded': [{'message': {'id': 'id1'}, 'labelIds': ['STARRED']}]},
+            {'labelsAdded': [{'message': {'id': 'id1'}, 'labelIds': ['IMPORTANT']}]},
+            {'labelsRemoved': [{'message': {'id': 'id9'}, 'labelIds': ['UNREAD']}]},
+        ])
+
+        with mock.patch.object(gmail_service, 'batch_get_messages', wraps=gmail_service.batch_get_messages) as get:
+            stats = self.sync(gmail_service)
+
+        # The unknown message is downloaded in full, the known one only has its labels refreshed
+        self.assertEqual(get.call_args_list, [
+            mock.call(['id9'], format='raw'),
+            mock.call(['id1'], format='minimal'),
+        ])
+        self.assertEqual(stats['labels_modified'], 3)
+        self.assertEqual(stats['errors'], [])
+        message = GoogleMailMessage.objects.get(message_id='id1')
+        self.assertEqual(message.label_ids, ['INBOX', 'STARRED'])
+        self.assertTrue(message.is_starred)
+        self.assertTrue(GoogleMailMessage.objects.filter(message_id='id9').exists())
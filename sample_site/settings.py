@@ -151,3 +151,28 @@ GOOGLE_USER_EMAIL = env('GOOGLE_USER_EMAIL', default=None)
 GOOGLE_API_SCOPES = env.list('GOOGLE_API_SCOPES', default=[
     'https://www.googleapis.com/auth/gmail.readonly'
 ])
+
+# Number of messages downloaded and stored per batch during a full sync
+GMAIL_SYNC_BATCH_SIZE = env.int('GMAIL_SYNC_BATCH_SIZE', default=500)
+
+# Number of Gmail HTTP batch requests (of up to 100 messages) fetched in parallel
+GMAIL_SYNC_CONCURRENCY = env.int('GMAIL_SYNC_CONCURRENCY', default=8)
+
+# Gmail quota units per second spent on downloading messages, per account and
+# worker process (Gmail allows 250 per user; a message costs 5)
+GMAIL_QUOTA_UNITS_PER_SECOND = env.int('GMAIL_QUOTA_UNITS_PER_SECOND', default=250)
+
+# Fetch messages with Gmail HTTP batch requests; when False they are fetched one
+# request per message, GMAIL_SYNC_CONCURRENCY at a time
+GMAIL_USE_BATCH_REQUESTS = env.bool('GMAIL_USE_BATCH_REQUESTS', default=True)
+
+# Download full message bodies; when False only the headers used for indexing are fetched
+GMAIL_DOWNLOAD_BODY = env.bool('GMAIL_DOWNLOAD_BODY', default=True)
+
+# Rows written per statement by bulk inserts and updates of messages
+INDEXER_BULK_BATCH_SIZE = env.int('INDEXER_BULK_BATCH_SIZE', default=500)
+
+# Celery result backend (read by a Celery app configured with namespace='CELERY').
+# The sync_configuration task syncs all mailboxes in parallel only when a result
+# backend is set, e.g. 'redis://localhost:6379/1'; without one it syncs them one by one
+CELERY_RESULT_BACKEND = env('CELERY_RESULT_BACKEND', default=None)